@@ -0,0 +1,102 @@
+import copy
+import gzip
+import json
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(SCRIPTS_DIR))
+FIXTURE_DIR = os.path.join(SCRIPTS_DIR, 'fixtures', 'replay')
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+DEFAULT_STORAGE = 'file://./.benchmarks'
+
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def pytest_configure(config):
+  # Saved runs and the committed baseline live next to the suite rather than
+  # in ./.benchmarks, so --benchmark-compare works from any directory.
+  if getattr(config.option, 'benchmark_storage', None) == DEFAULT_STORAGE:
+    config.option.benchmark_storage = 'file://' + BASELINE_DIR
+
+
+def load_fixture(name):
+  path = os.path.join(FIXTURE_DIR, name)
+  opener = gzip.open if path.endswith('.gz') else open
+  with opener(path, 'rb') as f:
+    return f.read().decode('utf-8')
+
+
+def load_resorts():
+  with open(os.path.join(REPO_ROOT, 'links.json'), 'r', encoding='utf-8') as f:
+    return json.load(f)
+
+
+def scaled_resorts(factor):
+  # links.json repeated `factor` times with distinct ids and names, for the
+  # "more resorts and coordinates" scaling runs.
+  resorts = load_resorts()
+  scaled = []
+  for copy_index in range(factor):
+    for resort in resorts:
+      resort = copy.deepcopy(resort)
+      if copy_index:
+        resort['id'] = f"{resort['id']}-{copy_index}"
+        resort['name'] = f"{resort['name']} {copy_index}"
+      scaled.append(resort)
+  return scaled
+
+
+def observation_text(hours):
+  # A KMA sfc_nc_var.php response with one row per hour.
+  header, _, rest = load_fixture('kma_sfc.txt').partition('#START7777')
+  rows = [
+    f"2026{1 + hour // 672:02d}{1 + hour // 24 % 28:02d}{hour % 24:02d}00, "
+    f"{-8 + hour % 9 * 0.7:.1f}, {60 + hour % 30:.1f}, {1 + hour % 5 * 0.4:.1f}, 0.0, 14.2, 0.0"
+    for hour in range(hours)
+  ]
+  return header + '#START7777\n' + '\n'.join(rows) + '\n#7777END\n'
+
+
+def weather_entries(resorts, hours):
+  entries = []
+  for resort in resorts:
+    for location in resort.get('coordinates', []):
+      entries.append({
+        'name': location['name'],
+        'resort': resort['name'],
+        'location': {'latitude': location['latitude'], 'longitude': location['longitude']},
+        'timestamp': '2026-01-15T09:00:00+09:00',
+        'data': [
+          {
+            'time': f"2026-01-{1 + hour // 24 % 28:02d}T{hour % 24:02d}:00:00+09:00",
+            'temperature': -8 + hour % 9 * 0.7,
+            'humidity': 60.0 + hour % 30,
+            'wind_speed': 1 + hour % 5 * 0.4,
+            'rainfall': 0.0,
+            'snow_cover': 14.2,
+            'snowfall_3hr': 0.0,
+          }
+          for hour in range(hours)
+        ],
+      })
+  return entries
+
+
+def large_resort_page(size):
+  # The generic webcam page padded with boilerplate markup up to `size`
+  # bytes ahead of the player script, like the heavier resort CMS pages.
+  page = load_fixture('webcam_m3u8.html')
+  block = (
+    '<div class="notice"><a href="/board/view.do?idx={0}">공지사항 {0}</a>'
+    '<img src="/upload/banner_{0}.jpg" alt="배너 {0}"><p>운영 시간 및 슬로프 현황 안내</p></div>\n'
+  )
+  padding = []
+  length = len(page)
+  index = 0
+  while length < size:
+    chunk = block.format(index)
+    padding.append(chunk)
+    length += len(chunk.encode('utf-8'))
+    index += 1
+  return page.replace('<div class="webcam-wrap">', ''.join(padding) + '<div class="webcam-wrap">', 1)
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+import fetch_weather_data  # noqa: E402
+from conftest import load_fixture, observation_text, scaled_resorts, weather_entries  # noqa: E402
+
+
+def test_process_grid(benchmark):
+  grid = load_fixture('kma_grid.txt.gz')
+  points = benchmark(fetch_weather_data.process_grid, grid)
+  assert len(points) > 30000
+
+
+@pytest.mark.parametrize('hours', [2, 24, 168])
+def test_parse_observation_rows(benchmark, hours):
+  content = observation_text(hours)
+  rows = benchmark(fetch_weather_data.parse_observation_rows, content)
+  assert len(rows) == hours
+
+
+def test_generate_preview_image(benchmark, tmp_path, monkeypatch):
+  # The image lists at most 12 resorts, so only the full set is measured.
+  monkeypatch.chdir(tmp_path)
+  resorts = scaled_resorts(1)
+  for resort in resorts:
+    resort.pop('hide_preview', None)
+  entries = weather_entries(resorts, 2)
+  benchmark.pedantic(fetch_weather_data.generate_preview_image, args=(entries, resorts), rounds=3, iterations=1)
+  assert (tmp_path / 'preview.png').exists()
+
+
+@pytest.mark.parametrize('factor,hours', [(1, 2), (10, 2), (1, 168)])
+def test_build_weather_delta(benchmark, factor, hours):
+  resorts = scaled_resorts(factor)
+  old = weather_entries(resorts, hours)
+  new = weather_entries(resorts, hours + 1)
+  for entry in new:
+    entry['data'] = entry['data'][1:]
+  delta = benchmark(fetch_weather_data.build_weather_delta, old, new)
+  assert len(delta['changed']) == len(old)
@@ -0,0 +1,44 @@
+import datetime
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+import webcam_scraper  # noqa: E402
+from conftest import large_resort_page, load_fixture, scaled_resorts  # noqa: E402
+
+M3U8_FIXTURE_URL = 'https://live.example-resort.co.kr/webcam/cam01/playlist.m3u8?token=replay'
+NOW = datetime.datetime(2026, 1, 15, 9, 0, 0)
+
+
+@pytest.mark.parametrize('size', [0, 256 * 1024, 1024 * 1024], ids=['fixture', '256k', '1m'])
+def test_find_m3u8_in_html(benchmark, size):
+  page = large_resort_page(size)
+  assert benchmark(webcam_scraper.find_m3u8_in_html, page) == M3U8_FIXTURE_URL
+
+
+def test_youtube_initial_data(benchmark):
+  page = load_fixture('youtube_streams.html.gz')
+  chunk_size = webcam_scraper.YT_CHUNK_SIZE
+  chunks = [page[i:i + chunk_size] for i in range(0, len(page), chunk_size)]
+
+  def find_live():
+    return webcam_scraper._find_live_video_id(webcam_scraper._iter_rich_items(chunks))
+
+  assert benchmark(find_live) == 'replayLive1'
+
+
+@pytest.mark.parametrize('factor', [1, 10, 100])
+def test_generate_video_ld_json(benchmark, tmp_path, monkeypatch, factor):
+  monkeypatch.chdir(tmp_path)
+  data = scaled_resorts(factor)
+  benchmark(webcam_scraper.generate_video_ld_json, data, NOW)
+  assert (tmp_path / 'videos+ld.json').exists()
+
+
+@pytest.mark.parametrize('factor', [1, 10, 100])
+def test_generate_sitemap(benchmark, tmp_path, monkeypatch, factor):
+  monkeypatch.chdir(tmp_path)
+  data = scaled_resorts(factor)
+  benchmark(webcam_scraper.generate_sitemap, data)
+  assert (tmp_path / 'sitemap.xml').exists()
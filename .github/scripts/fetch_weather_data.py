@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import requests
 import json
 import os
 import sys
@@ -16,11 +15,24 @@ from bs4 import BeautifulSoup
 import math
 import dotenv
 
+import http_client
+import output_manifest
+
 dotenv.load_dotenv()
 
 HOURS = 1
 INTERVAL = 60
 
+WEATHER_FILE = "weather.json"
+# weather.delta/<from>.json turns version <from> into the next version, and
+# weather.version.json lists the chain of <from> hashes ending at the latest.
+WEATHER_DELTA_DIR = "weather.delta"
+WEATHER_VERSION_FILE = "weather.version.json"
+WEATHER_DELTA_LIMIT = 12
+# Content-hashed copies of the outputs main.js loads, see output_manifest.py.
+WEATHER_OUTPUT_DIR = "weather-data"
+WEATHER_OUTPUTS = (WEATHER_FILE, "weather.grid.json")
+
 def format_datetime(dt):
   return dt.strftime("%Y%m%d%H%M")
 
@@ -33,6 +45,32 @@ def convert_to_iso8601(time_str):
 
   return f"{year}-{month}-{day}T{hour}:{minute}:00+09:00"
 
+def parse_observation_rows(content):
+  if "#START7777" not in content or "#7777END" not in content:
+    return None
+
+  data_text = content.split("#START7777")[1].split("#7777END")[0].strip()
+
+  data_rows = []
+  for line in data_text.split("\n"):
+    if not line.strip():
+      continue
+
+    parts = [part.strip() for part in line.split(",")]
+    if len(parts) >= 7:
+      iso_time = convert_to_iso8601(parts[0])
+      data_rows.append({
+        "time": iso_time,
+        "temperature": float(parts[1]),
+        "humidity": float(parts[2]),
+        "wind_speed": float(parts[3]),
+        "rainfall": float(parts[4]),
+        "snow_cover": float(parts[5]),
+        "snowfall_3hr": float(parts[6])
+      })
+
+  return data_rows
+
 def fetch_weather_data_for_location(lat, lon, location_name, resort_name, auth_key, is_north_korea=False):
   kst = pytz.timezone('Asia/Seoul')
   now = datetime.now(kst)
@@ -53,7 +91,7 @@ def fetch_weather_data_for_location(lat, lon, location_name, resort_name, auth_k
   url = base_url + params
 
   try:
-    response = requests.get(url, timeout=30)
+    response = http_client.get(url, timeout=30)
 
     if response.status_code == 403:
       print(f"Received 403 Forbidden from API for {location_name}")
@@ -66,34 +104,14 @@ def fetch_weather_data_for_location(lat, lon, location_name, resort_name, auth_k
       )
       return None
 
-    content = response.text
-    if "#START7777" not in content or "#7777END" not in content:
+    data_rows = parse_observation_rows(response.text)
+    if data_rows is None:
       print(
         f"Could not find data markers in API response for "
         f"{location_name}"
       )
       return None
 
-    data_text = content.split("#START7777")[1].split("#7777END")[0].strip()
-
-    data_rows = []
-    for line in data_text.split("\n"):
-      if not line.strip():
-        continue
-
-      parts = [part.strip() for part in line.split(",")]
-      if len(parts) >= 7:
-        iso_time = convert_to_iso8601(parts[0])
-        data_rows.append({
-          "time": iso_time,
-          "temperature": float(parts[1]),
-          "humidity": float(parts[2]),
-          "wind_speed": float(parts[3]),
-          "rainfall": float(parts[4]),
-          "snow_cover": float(parts[5]),
-          "snowfall_3hr": float(parts[6])
-        })
-
     return {
       "name": location_name,
       "resort": resort_name,
@@ -264,7 +282,7 @@ def fetch_weather_data_from_resort(resort_name, is_north_korea=False):
       print(f"No weather link found for {resort_name}")
       return None
 
-    response = requests.get(links[resort_name], timeout=30)
+    response = http_client.get(links[resort_name], timeout=30)
 
     if response.status_code != 200:
       print(f"Failed to fetch weather data from {resort_name}: {response.status_code}")
@@ -414,7 +432,7 @@ def fetch_weather_grid(auth_key):
     url = f"https://apihub.kma.go.kr/api/typ01/cgi-bin/url/nph-dfs_shrt_grd?tmfc={time1}&tmef={time2}&vars=TMP&authKey={auth_key}"
 
     try:
-      response = requests.get(url, timeout=30)
+      response = http_client.get(url, timeout=30)
 
       if response.status_code != 200:
         print(f"Error fetching weather grid data: HTTP {response.status_code} for url {url}")
@@ -486,7 +504,7 @@ def fetch_forecast_openweather(resorts):
 
     try:
       print(f'Fetching OpenWeatherMap data for {location["resort"]} - {location["name"]}')
-      response = requests.get(url, timeout=30)
+      response = http_client.get(url, timeout=30)
 
       if response.status_code != 200:
         print(f"Error fetching OpenWeatherMap data for {location['resort']} - {location['name']}: HTTP {response.status_code}")
@@ -541,6 +559,91 @@ def fetch_forecast_openweather(resorts):
 
   print(f"Successfully saved OpenWeatherMap data for {len(weathers)} locations")
 
+def weather_key(entry):
+  return f"{entry['resort']}:{entry['name']}"
+
+def diff_rows(old_rows, new_rows):
+  # Observation windows slide forward: find the longest tail of the old rows
+  # that the new rows start with, so the delta is "drop n, append the rest".
+  for start in range(len(old_rows) + 1):
+    overlap = old_rows[start:]
+    if new_rows[:len(overlap)] == overlap:
+      return {"drop": start, "append": new_rows[len(overlap):]}
+
+def diff_entry(old, new):
+  change = {}
+
+  fields = {k: v for k, v in new.items() if k != "data" and old.get(k) != v}
+  if fields:
+    change["set"] = fields
+
+  unset = [k for k in old if k not in new]
+  if unset:
+    change["unset"] = unset
+
+  rows = diff_rows(old.get("data", []), new.get("data", []))
+  if rows["drop"] or rows["append"]:
+    change["data"] = rows
+
+  return change
+
+def build_weather_delta(old_entries, new_entries):
+  old_map = {weather_key(entry): entry for entry in old_entries}
+  new_map = {weather_key(entry): entry for entry in new_entries}
+
+  changed = {}
+  for key, entry in new_map.items():
+    if key in old_map:
+      change = diff_entry(old_map[key], entry)
+      if change:
+        changed[key] = change
+
+  return {
+    "removed": [key for key in old_map if key not in new_map],
+    "changed": changed,
+    "added": [entry for key, entry in new_map.items() if key not in old_map],
+  }
+
+def save_weather_data(weather_data, previous_data, previous_payload):
+  payload = json.dumps(
+    weather_data, ensure_ascii=False, sort_keys=True, separators=(',', ':')
+  ).encode("utf-8")
+  new_hash = output_manifest.content_hash(payload)
+
+  with open(WEATHER_FILE, "wb") as f:
+    f.write(payload)
+  # Deployed even when empty; only the run that wrote a delta has it locally.
+  os.makedirs(WEATHER_DELTA_DIR, exist_ok=True)
+
+  if previous_payload is None:
+    chain = []
+  else:
+    old_hash = output_manifest.content_hash(previous_payload)
+    if old_hash == new_hash:
+      return
+
+    try:
+      with open(WEATHER_VERSION_FILE, "r", encoding="utf-8") as f:
+        version = json.load(f)
+      chain = version["deltas"] if version.get("hash") == old_hash else []
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+      chain = []
+
+    delta = {"from": old_hash, "to": new_hash, **build_weather_delta(previous_data, weather_data)}
+    with open(os.path.join(WEATHER_DELTA_DIR, f"{old_hash}.json"), "w", encoding="utf-8") as f:
+      json.dump(delta, f, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+    chain = (chain + [old_hash])[-WEATHER_DELTA_LIMIT:]
+    print(f"Wrote weather delta {old_hash} -> {new_hash} ({len(chain)} in chain)")
+
+  keep = {f"{h}.json" for h in chain}
+  for name in os.listdir(WEATHER_DELTA_DIR):
+    if name not in keep:
+      os.remove(os.path.join(WEATHER_DELTA_DIR, name))
+
+  with open(WEATHER_VERSION_FILE, "w", encoding="utf-8") as f:
+    json.dump({"hash": new_hash, "deltas": chain}, f, separators=(',', ':'))
+
 def main():
   auth_key = os.environ.get("KMA_API_KEY")
   if not auth_key:
@@ -557,11 +660,14 @@ def main():
   fetch_forecast_openweather(resorts)
 
   existing_weather_data = []
+  existing_payload = None
   try:
-    with open('weather.json', 'r', encoding='utf-8') as f:
-      existing_weather_data = json.load(f)
-      print(f"Loaded existing weather data with {len(existing_weather_data)} entries")
+    with open(WEATHER_FILE, 'rb') as f:
+      existing_payload = f.read()
+    existing_weather_data = json.loads(existing_payload)
+    print(f"Loaded existing weather data with {len(existing_weather_data)} entries")
   except (FileNotFoundError, json.JSONDecodeError) as e:
+    existing_payload = None
     print(f"No existing weather data found or file is invalid: {e}")
 
   weather_data_dict = {}
@@ -669,9 +775,8 @@ def main():
   updated_weather_data = list(weather_data_dict.values())
 
   if updated_weather_data:
-    output_file = "weather.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-      json.dump(updated_weather_data, f, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    output_file = WEATHER_FILE
+    save_weather_data(updated_weather_data, existing_weather_data, existing_payload)
 
     print(
       f"Successfully saved weather data for {len(updated_weather_data)} "
@@ -683,6 +788,8 @@ def main():
   else:
     print("No weather data collected")
 
+  output_manifest.publish(WEATHER_OUTPUT_DIR, WEATHER_OUTPUTS)
+
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+  import brotli  # noqa: F401  (lets urllib3 decode br responses)
+  ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+  ACCEPT_ENCODING = 'gzip, deflate'
+
+HEADERS = {
+  'User-Agent': (
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/135.0.0.0 Safari/537.36'
+  ),
+  'Accept-Encoding': ACCEPT_ENCODING,
+}
+
+CONNECT_TIMEOUT = 5
+DEFAULT_TIMEOUT = 30
+MAX_RESPONSE_BYTES = 16 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# One pool per host is kept for up to POOL_HOSTS hosts, each holding up to
+# POOL_MAXSIZE keep-alive connections (fetch_weather_data runs 40 workers
+# against the KMA API host).
+POOL_HOSTS = 32
+POOL_MAXSIZE = 40
+
+RETRY_POLICY = Retry(
+  total=2,
+  connect=2,
+  read=1,
+  backoff_factor=0.5,
+  status_forcelist=(429, 500, 502, 503, 504),
+  allowed_methods=frozenset(['GET', 'HEAD']),
+  respect_retry_after_header=True,
+  raise_on_status=False,
+)
+
+# With HTTP_REPLAY_URL set (e.g. http://127.0.0.1:8700), every request goes
+# to replay_server.py instead of the real upstream, as
+# <replay>/<scheme>/<host><path>?<query>.
+REPLAY_URL = os.environ.get('HTTP_REPLAY_URL', '').rstrip('/')
+
+TIMING_HOOKS = []
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+  pass
+
+
+def add_timing_hook(hook):
+  # hook(url, status_code, seconds, size) runs after every buffered request;
+  # streamed responses report size None since the body is read by the caller.
+  TIMING_HOOKS.append(hook)
+
+
+def _print_timing(url, status_code, seconds, size):
+  size_text = f"{size}B" if size is not None else "streamed"
+  print(f"[http] {status_code} {seconds * 1000:.0f}ms {size_text} {url}")
+
+
+if os.environ.get('HTTP_TIMING'):
+  add_timing_hook(_print_timing)
+
+
+def get_session():
+  global _session
+  with _session_lock:
+    if _session is None:
+      session = requests.Session()
+      adapter = HTTPAdapter(
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=RETRY_POLICY,
+      )
+      session.mount('http://', adapter)
+      session.mount('https://', adapter)
+      session.headers.update(HEADERS)
+      _session = session
+  return _session
+
+
+def _read_capped(response, max_bytes):
+  length = response.headers.get('Content-Length')
+  if length and length.isdigit() and int(length) > max_bytes:
+    raise ResponseTooLarge(f"{response.url} is {length} bytes (limit {max_bytes})")
+
+  chunks = []
+  size = 0
+  for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+    size += len(chunk)
+    if size > max_bytes:
+      raise ResponseTooLarge(f"{response.url} exceeded {max_bytes} bytes")
+    chunks.append(chunk)
+
+  # Hand the body back to requests so .text / .json() behave as usual.
+  response._content = b''.join(chunks)
+  return size
+
+
+def replay_url(url, base):
+  parts = urlsplit(url)
+  query = f"?{parts.query}" if parts.query else ''
+  return f"{base}/{parts.scheme}/{parts.netloc}{parts.path or '/'}{query}"
+
+
+def get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, stream=False, max_bytes=MAX_RESPONSE_BYTES):
+  if REPLAY_URL:
+    url = replay_url(url, REPLAY_URL)
+
+  started = time.perf_counter()
+  response = get_session().get(
+    url,
+    params=params,
+    headers=headers,
+    timeout=(min(CONNECT_TIMEOUT, timeout), timeout),
+    stream=True,
+  )
+
+  size = None
+  if not stream:
+    try:
+      size = _read_capped(response, max_bytes)
+    finally:
+      response.close()
+
+  elapsed = time.perf_counter() - started
+  for hook in TIMING_HOOKS:
+    hook(response.url, response.status_code, elapsed, size)
+
+  return response
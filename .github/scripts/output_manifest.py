@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import time
+
+# Each generator publishes content-hashed copies of its outputs into its own
+# directory (weather-data/weather.<hash>.json, ...) next to a manifest.json
+# that maps the plain names to the current copies. The hashed files never
+# change, so they can be cached as immutable; only the manifest needs a short
+# TTL. Superseded copies are kept for OUTPUT_RETENTION seconds so pages that
+# loaded an older manifest can still fetch what it points at.
+MANIFEST_NAME = 'manifest.json'
+OUTPUT_RETENTION = 6 * 60 * 60
+
+
+def content_hash(payload):
+  return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def hashed_name(name, digest):
+  stem, ext = os.path.splitext(name)
+  return f"{stem}.{digest}{ext}"
+
+
+def load_manifest(directory):
+  try:
+    with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+      manifest = json.load(f)
+    return manifest if isinstance(manifest, dict) else {}
+  except (FileNotFoundError, json.JSONDecodeError):
+    return {}
+
+
+def _write_atomic(path, payload):
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(payload)
+  os.replace(tmp_path, path)
+
+
+def publish(directory, names, retention=OUTPUT_RETENTION):
+  os.makedirs(directory, exist_ok=True)
+  manifest = load_manifest(directory)
+  now = time.time()
+
+  for name in names:
+    try:
+      with open(name, 'rb') as f:
+        payload = f.read()
+    except FileNotFoundError:
+      continue
+
+    target = hashed_name(os.path.basename(name), content_hash(payload))
+    previous = manifest.get(name)
+    if previous == target and os.path.exists(os.path.join(directory, target)):
+      continue
+
+    _write_atomic(os.path.join(directory, target), payload)
+    if previous and previous != target:
+      # The retention window starts when a copy stops being current.
+      try:
+        os.utime(os.path.join(directory, previous), (now, now))
+      except FileNotFoundError:
+        pass
+    manifest[name] = target
+    print(f"Published {name} as {directory}/{target}")
+
+  _write_atomic(
+    os.path.join(directory, MANIFEST_NAME),
+    json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode('utf-8'),
+  )
+
+  current = set(manifest.values()) | {MANIFEST_NAME}
+  for entry in os.listdir(directory):
+    path = os.path.join(directory, entry)
+    if entry in current or not os.path.isfile(path):
+      continue
+    if os.stat(path).st_mtime < now - retention:
+      os.remove(path)
+      print(f"Pruned {directory}/{entry}")
+
+  return manifest
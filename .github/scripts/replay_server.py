@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Serves recorded upstream responses so the fetch scripts can be run and
+# load-tested offline. Point them here with HTTP_REPLAY_URL (see
+# http_client.py); requests then arrive as /<scheme>/<host><path>?<query>
+# and are matched against "<host><path>" by the first route whose regex
+# fits, so the catch-all route must stay last.
+#
+# Per route: latency_ms +- jitter_ms, error_rate (a 5xx from error_statuses),
+# stall_rate/stall_ms (sleeps past the client timeout), rate_per_sec/burst
+# (429 with Retry-After beyond a token bucket) and forbidden_burst
+# {every, length} (the last `length` of every `every` requests get a 403,
+# like the KMA API does when a key is throttled).
+
+PORT = 8700
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'replay')
+ROUTES_FILE = os.path.join(FIXTURE_DIR, 'routes.json')
+STATS_PATH = '/_replay/stats'
+RESET_PATH = '/_replay/reset'
+DEFAULT_ERROR_STATUSES = (500, 502, 503)
+DEFAULT_STALL_MS = 30000
+
+
+class Route:
+  def __init__(self, config, fixture_dir, seed=0):
+    self.name = config['name']
+    self.pattern = re.compile(config['match'])
+    self.content_type = config.get('content_type', 'application/octet-stream')
+    self.latency = config.get('latency_ms', 0) / 1000
+    self.jitter = config.get('jitter_ms', 0) / 1000
+    self.error_rate = config.get('error_rate', 0)
+    self.error_statuses = tuple(config.get('error_statuses', DEFAULT_ERROR_STATUSES))
+    self.stall_rate = config.get('stall_rate', 0)
+    self.stall = config.get('stall_ms', DEFAULT_STALL_MS) / 1000
+    self.rate = config.get('rate_per_sec')
+    self.burst = config.get('burst', self.rate or 0)
+    self.forbidden_burst = config.get('forbidden_burst')
+
+    path = os.path.join(fixture_dir, config['fixture'])
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+      self.body = f.read()
+
+    self.seed = f"{seed}:{self.name}"
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    with self.lock:
+      self.random = random.Random(self.seed)
+      self.count = 0
+      self.in_flight = 0
+      self.peak_in_flight = 0
+      self.statuses = {}
+      self.tokens = self.burst
+      self.refilled = time.monotonic()
+
+  def begin(self, latency_scale, errors):
+    # Decides the outcome of one request; returns (status, delay seconds).
+    with self.lock:
+      index = self.count
+      self.count += 1
+      self.in_flight += 1
+      self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+      roll = self.random.random()
+      delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)) * latency_scale
+
+      if self.rate:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens < 1:
+          return HTTPStatus.TOO_MANY_REQUESTS, 0.0
+        self.tokens -= 1
+
+      if errors:
+        burst = self.forbidden_burst
+        if burst and index % burst['every'] >= burst['every'] - burst['length']:
+          return HTTPStatus.FORBIDDEN, delay
+        if roll < self.error_rate:
+          return self.random.choice(self.error_statuses), delay
+        if roll < self.error_rate + self.stall_rate:
+          return HTTPStatus.OK, self.stall
+
+      return HTTPStatus.OK, delay
+
+  def end(self, status):
+    with self.lock:
+      self.in_flight -= 1
+      self.statuses[status] = self.statuses.get(status, 0) + 1
+
+  def stats(self):
+    with self.lock:
+      return {
+        'requests': self.count,
+        'in_flight': self.in_flight,
+        'peak_in_flight': self.peak_in_flight,
+        'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+      }
+
+
+def load_routes(path=ROUTES_FILE, seed=0):
+  with open(path, 'r', encoding='utf-8') as f:
+    config = json.load(f)
+  fixture_dir = os.path.dirname(os.path.abspath(path))
+  return [Route(route, fixture_dir, seed) for route in config['routes']]
+
+
+def find_route(routes, target):
+  for route in routes:
+    if route.pattern.search(target):
+      return route
+  return None
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, format, *args):
+    if not self.server.quiet:
+      super().log_message(format, *args)
+
+  def do_GET(self):
+    path = self.path.partition('?')[0]
+    if path == STATS_PATH:
+      self.send_json({route.name: route.stats() for route in self.server.routes})
+      return
+    if path == RESET_PATH:
+      for route in self.server.routes:
+        route.reset()
+      self.send_json({'reset': True})
+      return
+
+    # /<scheme>/<host>/<path> -> "<host>/<path>"
+    parts = path.lstrip('/').split('/', 1)
+    target = parts[1] if len(parts) == 2 and parts[0] in ('http', 'https') else ''
+    if '/' not in target:
+      target += '/'
+    route = find_route(self.server.routes, target) if target != '/' else None
+    if route is None:
+      self.send_plain(HTTPStatus.NOT_FOUND, f"No replay route for {self.path}\n".encode('utf-8'))
+      return
+
+    status, delay = route.begin(self.server.latency_scale, self.server.errors)
+    try:
+      if delay:
+        time.sleep(delay)
+      if status == HTTPStatus.OK:
+        self.send_response(status)
+        self.send_header('Content-Type', route.content_type)
+        self.send_header('Content-Length', str(len(route.body)))
+        self.end_headers()
+        self.wfile.write(route.body)
+      elif status == HTTPStatus.TOO_MANY_REQUESTS:
+        self.send_plain(status, b'Too Many Requests\n', {'Retry-After': '1'})
+      else:
+        self.send_plain(status, f"{int(status)} from replay route {route.name}\n".encode('utf-8'))
+    except (BrokenPipeError, ConnectionResetError):
+      pass
+    finally:
+      route.end(int(status))
+
+  def send_plain(self, status, body, headers=None):
+    self.send_response(status)
+    self.send_header('Content-Type', 'text/plain; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def send_json(self, data):
+    body = json.dumps(data, indent=2, sort_keys=True).encode('utf-8')
+    self.send_response(HTTPStatus.OK)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('Cache-Control', 'no-store')
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class ReplayServer(ThreadingHTTPServer):
+  daemon_threads = True
+  request_queue_size = 256
+
+  def __init__(self, address, routes, latency_scale=1.0, errors=True, quiet=False):
+    super().__init__(address, ReplayHandler)
+    self.routes = routes
+    self.latency_scale = latency_scale
+    self.errors = errors
+    self.quiet = quiet
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Replay recorded upstream responses for the fetch scripts')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=PORT)
+  parser.add_argument('--routes', default=ROUTES_FILE, help='route and fixture config (JSON)')
+  parser.add_argument('--seed', type=int, default=0, help='seed for latency, errors and stalls')
+  parser.add_argument(
+    '--latency-scale', type=float, default=1.0,
+    help='multiply every route latency and jitter (0 answers immediately)',
+  )
+  parser.add_argument('--no-errors', action='store_true', help='disable injected errors, stalls and 403 bursts')
+  parser.add_argument('--quiet', action='store_true', help='do not log each request')
+  args = parser.parse_args()
+
+  routes = load_routes(args.routes, args.seed)
+  with ReplayServer((args.host, args.port), routes, args.latency_scale, not args.no_errors, args.quiet) as httpd:
+    print(f"Replaying {len(routes)} routes at http://{args.host}:{args.port}")
+    print(f"Run the scripts with HTTP_REPLAY_URL=http://{args.host}:{args.port}; stats at {STATS_PATH}")
+    try:
+      httpd.serve_forever()
+    except KeyboardInterrupt:
+      pass
+
+
+if __name__ == '__main__':
+  main()
@@ -1,69 +1,68 @@
 #!/usr/bin/env python3
-import requests
 from bs4 import BeautifulSoup
+import gzip
+import hashlib
 import json
+import os
 import re
+import shutil
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 import datetime
 from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+from xml.sax.saxutils import escape
 
+import http_client
+import output_manifest
 
-def extract_m3u8_from_url(url):
-  headers = {
-    'User-Agent': (
-      'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
-      'AppleWebKit/537.36 (KHTML, like Gecko) '
-      'Chrome/135.0.0.0 Safari/537.36'
-    )
-  }
 
-  try:
-    response = requests.get(url, headers=headers, timeout=5)
-    response.raise_for_status()
+M3U8_PATTERN = re.compile(r'https?://[^\s\'"]+\.m3u8[^\s\'"]*')
+YOUTUBE_EMBED_PATTERN = re.compile(r'youtube\.com/embed/')
+RTSP_ME_STREAM_PATTERN = re.compile(r"\$\.(?:get|post)\('([^']+\.m3u8[^']*)'\)")
 
-    soup = BeautifulSoup(response.text, 'html.parser')
 
-    page_text = soup.get_text()
-    m3u8_pattern = r'https?://[^\s\'"]+\.m3u8[^\s\'"]*'
-    m3u8_matches = re.findall(m3u8_pattern, page_text)
-    if m3u8_matches:
-      return m3u8_matches[0]
+def find_m3u8_in_html(html):
+  soup = BeautifulSoup(html, 'html.parser')
 
-    for script in soup.find_all('script'):
-      if script.string:
-        script_m3u8 = re.findall(m3u8_pattern, script.string)
-        if script_m3u8:
-          return script_m3u8[0]
-
-    for tag in soup.find_all(True):
-      for attr in tag.attrs:
-        if isinstance(tag[attr], str) and '.m3u8' in tag[attr]:
-          attr_m3u8 = re.findall(m3u8_pattern, tag[attr])
-          if attr_m3u8:
-            return attr_m3u8[0]
+  page_text = soup.get_text()
+  m3u8_match = M3U8_PATTERN.search(page_text)
+  if m3u8_match:
+    return m3u8_match.group(0)
 
-    return None
+  for script in soup.find_all('script'):
+    if script.string:
+      script_m3u8 = M3U8_PATTERN.search(script.string)
+      if script_m3u8:
+        return script_m3u8.group(0)
+
+  for tag in soup.find_all(True):
+    for attr in tag.attrs:
+      if isinstance(tag[attr], str) and '.m3u8' in tag[attr]:
+        attr_m3u8 = M3U8_PATTERN.search(tag[attr])
+        if attr_m3u8:
+          return attr_m3u8.group(0)
+
+  return None
+
+
+def extract_m3u8_from_url(url, timeout=5):
+  try:
+    response = http_client.get(url, timeout=timeout)
+    response.raise_for_status()
+    return find_m3u8_in_html(response.text)
   except Exception as e:
     print(f"Error extracting m3u8 from {url}: {e}")
     return None
 
 
-def get_alpensia_youtube_embed_element(url='https://www.alpensia.com/guide/web-cam.do'):
-  headers = {
-    'User-Agent': (
-      'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
-      'AppleWebKit/537.36 (KHTML, like Gecko) '
-      'Chrome/135.0.0.0 Safari/537.36'
-    )
-  }
-
+def get_alpensia_youtube_embed_element(url='https://www.alpensia.com/guide/web-cam.do', timeout=5):
   try:
-    response = requests.get(url, headers=headers, timeout=5)
+    response = http_client.get(url, timeout=timeout)
     response.raise_for_status()
 
     soup = BeautifulSoup(response.text, 'html.parser')
-    iframe = soup.find('iframe', src=re.compile(r'youtube\.com/embed/'))
+    iframe = soup.find('iframe', src=YOUTUBE_EMBED_PATTERN)
 
     if iframe and iframe.get('src'):
       print(f"[alpensia] Found YouTube embed iframe: {iframe.get('src')}")
@@ -124,66 +123,84 @@ def _find_live_video_id(contents):
   return fallback_id
 
 
-def get_youtube_live_video_id(channel_url):
-  headers = {
-    'User-Agent': (
-      'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
-      'AppleWebKit/537.36 (KHTML, like Gecko) '
-      'Chrome/135.0.0.0 Safari/537.36'
-    )
-  }
+YT_INITIAL_DATA_START = 'var ytInitialData = '
+YT_INITIAL_DATA_END = ';</script>'
+YT_RICH_ITEM_KEY = '"richItemRenderer":'
+YT_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_rich_items(chunks):
+  # Scans the ytInitialData blob as it streams in and decodes only the
+  # richItemRenderer subtrees, so the rest of the page is never materialized.
+  decoder = json.JSONDecoder()
+  chunks = iter(chunks)
+  keep = max(len(YT_INITIAL_DATA_START), len(YT_RICH_ITEM_KEY)) - 1
+  buffer = ''
+  started = False
+  exhausted = False
+
+  while True:
+    if not started:
+      index = buffer.find(YT_INITIAL_DATA_START)
+      if index != -1:
+        buffer = buffer[index + len(YT_INITIAL_DATA_START):]
+        started = True
+        continue
+      buffer = buffer[-keep:]
+    else:
+      index = buffer.find(YT_RICH_ITEM_KEY)
+      end_index = buffer.find(YT_INITIAL_DATA_END)
+      if end_index != -1 and (index == -1 or end_index < index):
+        return
+
+      if index != -1:
+        value_index = index + len(YT_RICH_ITEM_KEY)
+        while value_index < len(buffer) and buffer[value_index].isspace():
+          value_index += 1
+
+        try:
+          value, value_end = decoder.raw_decode(buffer, value_index)
+        except json.JSONDecodeError:
+          # Subtree is still incomplete; pull another chunk and retry.
+          if exhausted:
+            return
+        else:
+          yield {'richItemRenderer': value}
+          buffer = buffer[value_end:]
+          continue
+      else:
+        buffer = buffer[-keep:]
 
-  try:
-    response = requests.get(channel_url, headers=headers, timeout=10)
-    response.raise_for_status()
+    if exhausted:
+      if not started:
+        raise ValueError('ytInitialData not found')
+      return
 
-    text = response.text
-    start_token = 'var ytInitialData = '
-    start_index = text.find(start_token)
-    if start_index == -1:
-      print(f"[youtube] ytInitialData not found on {channel_url}")
-      return None
-
-    start_index += len(start_token)
-    end_index = text.find(';</script>', start_index)
-    if end_index == -1:
-      print(f"[youtube] ytInitialData end tag not found on {channel_url}")
-      return None
-
-    json_text = text[start_index:end_index]
-    data = json.loads(json_text)
-
-    tabs = (
-      data.get('contents', {})
-      .get('twoColumnBrowseResultsRenderer', {})
-      .get('tabs', [])
-    )
+    chunk = next(chunks, None)
+    if chunk is None:
+      exhausted = True
+    else:
+      buffer += chunk
 
-    def extract_contents(tab_renderer):
-      if not tab_renderer:
-        return []
-      content = tab_renderer.get('content', {})
-      rich_grid = content.get('richGridRenderer')
-      if not rich_grid:
-        return []
-      return rich_grid.get('contents', [])
-
-    for tab in tabs:
-      renderer = tab.get('tabRenderer')
-      if renderer and renderer.get('selected'):
-        contents = extract_contents(renderer)
-        live_video_id = _find_live_video_id(contents)
-        if live_video_id:
-          return live_video_id
-
-    for tab in tabs:
-      renderer = tab.get('tabRenderer')
-      contents = extract_contents(renderer)
-      if not contents:
-        continue
-      live_video_id = _find_live_video_id(contents)
-      if live_video_id:
-        return live_video_id
+
+def get_youtube_live_video_id(channel_url, timeout=10):
+  try:
+    response = http_client.get(channel_url, timeout=timeout, stream=True)
+    try:
+      response.raise_for_status()
+      if not response.encoding:
+        response.encoding = 'utf-8'
+
+      # Only the selected tab carries a richGridRenderer, so the first live
+      # item in document order is the same one the full parse would pick.
+      # Returning early stops the iteration and the download with it.
+      chunks = response.iter_content(chunk_size=YT_CHUNK_SIZE, decode_unicode=True)
+      live_video_id = _find_live_video_id(_iter_rich_items(chunks))
+    finally:
+      response.close()
+
+    if live_video_id:
+      return live_video_id
 
     print(f"[youtube] No live video found on {channel_url}")
   except Exception as e:
@@ -227,28 +244,19 @@ def ensure_proxy_ip(video_url, proxy_ip):
   return proxy_url
 
 
-def get_rtsp_me_stream_url(embed_url, proxy_ip=None):
-  headers = {
-    'User-Agent': (
-      'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
-      'AppleWebKit/537.36 (KHTML, like Gecko) '
-      'Chrome/135.0.0.0 Safari/537.36'
-    )
-  }
-
+def get_rtsp_me_stream_url(embed_url, proxy_ip=None, timeout=5):
   try:
-    response = requests.get(embed_url, headers=headers, timeout=5)
+    response = http_client.get(embed_url, timeout=timeout)
     response.raise_for_status()
 
     soup = BeautifulSoup(response.text, 'html.parser')
-    pattern = re.compile(r"\$\.(?:get|post)\('([^']+\.m3u8[^']*)'\)")
 
     for script in soup.find_all('script'):
       script_text = script.string or script.get_text()
       if not script_text:
         continue
 
-      match = pattern.search(script_text)
+      match = RTSP_ME_STREAM_PATTERN.search(script_text)
       if match:
         stream_url = match.group(1)
         proxy_url, normalized_url = build_proxied_url(stream_url, proxy_ip)
@@ -262,79 +270,323 @@ def get_rtsp_me_stream_url(embed_url, proxy_ip=None):
   return None
 
 
-def process_link(item, resort_id):
-  link = item.get('link')
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+_extract_cache = {}
+_extract_cache_lock = threading.Lock()
+
+
+def find_resort_handler(resort_id, link):
+  for handler in RESORT_HANDLERS:
+    if handler['resort_id'] is not None and handler['resort_id'] != resort_id:
+      continue
+    if handler['matcher'].search(link):
+      return handler
+  return None
+
+
+def _host_slot(handler, link):
+  key = (handler['name'], urlparse(link).netloc)
+  with _host_slots_lock:
+    slot = _host_slots.get(key)
+    if slot is None:
+      slot = threading.BoundedSemaphore(handler['policy']['concurrency'])
+      _host_slots[key] = slot
+  return slot
+
+
+def run_extract(handler, link):
+  policy = handler['policy']
+  key = (handler['name'], link)
+
+  with _extract_cache_lock:
+    cached = _extract_cache.get(key)
+  if cached and cached[0] > time.monotonic():
+    return cached[1]
+
+  with _host_slot(handler, link):
+    value = handler['extract'](link, policy)
+
+  if value is not None and policy['cache_ttl'] > 0:
+    with _extract_cache_lock:
+      _extract_cache[key] = (time.monotonic() + policy['cache_ttl'], value)
+
+  return value
+
+
+def _extract_alpensia(link, policy):
+  iframe = get_alpensia_youtube_embed_element(link, timeout=policy['timeout'])
+  if iframe and iframe.get('src'):
+    return iframe.get('src')
+  return None
+
+
+def _apply_alpensia(item, embed_src, resort_id):
+  if not embed_src:
+    print("[alpensia] Unable to locate YouTube embed iframe")
+    return False
+
+  if item.get('video') == embed_src:
+    print("[alpensia] Video link already up to date")
+    return False
+
+  item['video'] = embed_src
+  print(f"[alpensia] Updated video link to {embed_src}")
+  return True
+
+
+def _extract_elysian(link, policy):
+  return get_youtube_live_video_id(link, timeout=policy['timeout'])
+
+
+def _apply_elysian(item, live_video_id, resort_id):
+  if not live_video_id:
+    print("[elysian] Unable to locate live YouTube video")
+    return False
+
+  modified = False
+  live_video_url = f"https://www.youtube.com/watch?v={live_video_id}"
+  if item.get('video') != live_video_url:
+    item['video'] = live_video_url
+    print(f"[elysian] Updated video link to {live_video_url}")
+    modified = True
+
+  if item.get('video_type') != 'youtube':
+    item['video_type'] = 'youtube'
+    modified = True
+
+  if item.get('name') != '실시간 영상':
+    item['name'] = '실시간 영상'
+    modified = True
+
+  return modified
+
+
+EDENVALLEY_PROXY_IP = '130.162.144.168'
+
+
+def _extract_edenvalley(link, policy):
+  return get_rtsp_me_stream_url(link, proxy_ip=EDENVALLEY_PROXY_IP, timeout=policy['timeout'])
+
+
+def _apply_edenvalley(item, proxied_url, resort_id):
   video = item.get('video')
-  result = {"modified": False, "item": item}
+  if not proxied_url and video:
+    proxied_url = ensure_proxy_ip(video, EDENVALLEY_PROXY_IP)
 
-  if link:
-    print(f"[{resort_id}] Processing link: {link}")
+  if not proxied_url:
+    print(f"[edenvalley] Unable to fetch stream url for {item.get('link')}")
+    return False
 
-    if resort_id == 'alpensia' and 'alpensia.com/guide/web-cam.do' in link:
-      iframe = get_alpensia_youtube_embed_element(link)
-      if iframe and iframe.get('src'):
-        embed_src = iframe.get('src')
-        if video != embed_src:
-          item['video'] = embed_src
-          print(f"[alpensia] Updated video link to {embed_src}")
-          result["modified"] = True
-        else:
-          print("[alpensia] Video link already up to date")
-      else:
-        print("[alpensia] Unable to locate YouTube embed iframe")
+  if video == proxied_url:
+    return False
 
-      return result
+  item['video'] = proxied_url
+  print(f"[edenvalley] Updated video link to {proxied_url}")
+  return True
 
-    if resort_id == 'elysian' and 'youtube.com/@11-lf8zw' in link:
-      live_video_id = get_youtube_live_video_id(link)
-      if live_video_id:
-        live_video_url = f"https://www.youtube.com/watch?v={live_video_id}"
-        if video != live_video_url:
-          item['video'] = live_video_url
-          print(f"[elysian] Updated video link to {live_video_url}")
-          result["modified"] = True
-
-        if item.get('video_type') != 'youtube':
-          item['video_type'] = 'youtube'
-          result["modified"] = True
-
-        if item.get('name') != '실시간 영상':
-          item['name'] = '실시간 영상'
-          result["modified"] = True
-      else:
-        print("[elysian] Unable to locate live YouTube video")
 
-      return result
+def _extract_m3u8(link, policy):
+  if link.endswith('.m3u8'):
+    return link
+  return extract_m3u8_from_url(link, timeout=policy['timeout'])
 
-    if resort_id == 'edenvalley' and 'rtsp.me/embed' in link:
-      proxy_ip = '130.162.144.168'
-      proxied_url = get_rtsp_me_stream_url(link, proxy_ip=proxy_ip)
-      if not proxied_url and video:
-        proxied_url = ensure_proxy_ip(video, proxy_ip)
-      if proxied_url:
-        if video != proxied_url:
-          item['video'] = proxied_url
-          print(f"[edenvalley] Updated video link to {proxied_url}")
-          result["modified"] = True
+
+def _apply_m3u8(item, m3u8_link, resort_id):
+  link = item.get('link')
+  if m3u8_link == link:
+    item['video'] = link
+    print(f"[{resort_id}] Link is already an m3u8 link: {link}")
+    return True
+
+  if not m3u8_link:
+    print(f"[{resort_id}] No m3u8 link found for {link}")
+    return False
+
+  item['video'] = m3u8_link
+  print(f"[{resort_id}] Found m3u8 link: {m3u8_link}")
+  return True
+
+
+def _apply_o2resort(item, m3u8_link, resort_id):
+  if m3u8_link and m3u8_link != item.get('link'):
+    m3u8_link = m3u8_link.replace('http://', '/stream_proxy/http/')
+  return _apply_m3u8(item, m3u8_link, resort_id)
+
+
+def _fetch_policy(timeout=5, cache_ttl=0, concurrency=4):
+  return {'timeout': timeout, 'cache_ttl': cache_ttl, 'concurrency': concurrency}
+
+
+# Handlers are matched in order, so the catch-all entry must stay last.
+# extract(link, policy) does the network work and is scheduled by
+# run_extract under the handler's per-host concurrency limit; apply(item,
+# value, resort_id) updates the item and returns whether it changed.
+RESORT_HANDLERS = [
+  {
+    'name': 'alpensia',
+    'resort_id': 'alpensia',
+    'matcher': re.compile(r'alpensia\.com/guide/web-cam\.do'),
+    'policy': _fetch_policy(cache_ttl=300, concurrency=1),
+    'extract': _extract_alpensia,
+    'apply': _apply_alpensia,
+  },
+  {
+    'name': 'elysian',
+    'resort_id': 'elysian',
+    'matcher': re.compile(r'youtube\.com/@11-lf8zw'),
+    'policy': _fetch_policy(timeout=10, cache_ttl=300, concurrency=1),
+    'extract': _extract_elysian,
+    'apply': _apply_elysian,
+  },
+  {
+    'name': 'edenvalley',
+    'resort_id': 'edenvalley',
+    'matcher': re.compile(r'rtsp\.me/embed'),
+    'policy': _fetch_policy(concurrency=2),
+    'extract': _extract_edenvalley,
+    'apply': _apply_edenvalley,
+  },
+  {
+    'name': 'o2resort',
+    'resort_id': 'o2resort',
+    'matcher': re.compile(r''),
+    'policy': _fetch_policy(cache_ttl=60),
+    'extract': _extract_m3u8,
+    'apply': _apply_o2resort,
+  },
+  {
+    'name': 'm3u8',
+    'resort_id': None,
+    'matcher': re.compile(r''),
+    'policy': _fetch_policy(cache_ttl=60),
+    'extract': _extract_m3u8,
+    'apply': _apply_m3u8,
+  },
+]
+
+
+# Content-hashed copies of links.json for main.js, see output_manifest.py.
+LINKS_OUTPUT_DIR = 'links-data'
+
+SCRAPE_STATE_PATH = os.environ.get('SCRAPE_STATE_FILE', 'scrape-state.json')
+SCRAPE_DUE_ONLY = bool(os.environ.get('SCRAPE_DUE_ONLY'))
+# Fields restored from the schedule for cameras skipped as not due, since
+# the checked-out links.json only carries the committed values.
+SCRAPED_FIELDS = ('video', 'video_type', 'name')
+
+REFRESH_MIN_INTERVAL = 20 * 60
+REFRESH_DEFAULT_INTERVAL = 2 * 60 * 60
+REFRESH_MAX_INTERVAL = 24 * 60 * 60
+REFRESH_HISTORY = 8
+
+_scrape_state = {}
+_scrape_state_lock = threading.Lock()
+
+
+def load_scrape_state():
+  try:
+    with open(SCRAPE_STATE_PATH, 'r', encoding='utf-8') as f:
+      _scrape_state.update(json.load(f))
+    print(f"Loaded refresh schedule for {len(_scrape_state)} cameras")
+  except (OSError, ValueError) as e:
+    print(f"No refresh schedule loaded, every camera is due: {e}")
+
+
+def save_scrape_state(data):
+  live_keys = {
+    camera_key(resort.get('id', 'unknown'), item)
+    for resort in data
+    for item in resort.get('links', [])
+    if item.get('link')
+  }
+  with _scrape_state_lock:
+    state = {key: entry for key, entry in _scrape_state.items() if key in live_keys}
+
+  with open(SCRAPE_STATE_PATH, 'w', encoding='utf-8') as f:
+    json.dump(state, f, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def camera_key(resort_id, item):
+  return f"{resort_id}|{item.get('link')}"
+
+
+def is_camera_due(resort_id, item, now):
+  with _scrape_state_lock:
+    entry = _scrape_state.get(camera_key(resort_id, item))
+  return entry is None or entry['next_due'] <= now
+
+
+def restore_camera_fields(resort_id, item):
+  with _scrape_state_lock:
+    entry = _scrape_state.get(camera_key(resort_id, item))
+    fields = dict(entry.get('fields', {})) if entry else {}
+
+  modified = False
+  for field, value in fields.items():
+    if item.get(field) != value:
+      item[field] = value
+      modified = True
+  return modified
+
+
+def record_camera_check(resort_id, item, changed, failed, now):
+  # A change halves the interval. A camera whose recent history has no
+  # changes at all backs off exponentially; one that changed recently only
+  # stretches slowly, so it stays close to its observed rotation period.
+  # Failed fetches leave the interval alone so a flaky host is not hammered.
+  key = camera_key(resort_id, item)
+  with _scrape_state_lock:
+    entry = _scrape_state.setdefault(key, {
+      'interval': REFRESH_DEFAULT_INTERVAL,
+      'history': [],
+      'last_changed': None,
+    })
+    interval = entry['interval']
+    history = entry['history']
+
+    if not failed:
+      history.append(1 if changed else 0)
+      del history[:-REFRESH_HISTORY]
+
+      if changed:
+        entry['last_changed'] = now
+        interval = interval / 2
+      elif not any(history):
+        interval = interval * 2
       else:
-        print(f"[edenvalley] Unable to fetch stream url for {link}")
+        interval = interval * 1.25
+
+    interval = int(min(REFRESH_MAX_INTERVAL, max(REFRESH_MIN_INTERVAL, interval)))
+    entry['interval'] = interval
+    entry['last_checked'] = now
+    entry['next_due'] = now + interval
+    entry['fields'] = {field: item[field] for field in SCRAPED_FIELDS if field in item}
+
+
+def process_link(item, resort_id):
+  link = item.get('link')
+  video = item.get('video')
+  result = {"modified": False, "item": item}
 
+  if link:
+    now = int(time.time())
+    if SCRAPE_DUE_ONLY and not is_camera_due(resort_id, item, now):
+      print(f"[{resort_id}] Not due yet: {link}")
+      result["modified"] = restore_camera_fields(resort_id, item)
       return result
 
-    if link.endswith('.m3u8'):
-      item['video'] = link
-      print(f"[{resort_id}] Link is already an m3u8 link: {link}")
-      result["modified"] = True
-    else:
-      m3u8_link = extract_m3u8_from_url(link)
-      if resort_id == 'o2resort':
-        m3u8_link = m3u8_link.replace('http://', '/stream_proxy/http/')
-      if m3u8_link:
-        item['video'] = m3u8_link
-        print(f"[{resort_id}] Found m3u8 link: {m3u8_link}")
-        result["modified"] = True
-      else:
-        print(f"[{resort_id}] No m3u8 link found for {link}")
+    print(f"[{resort_id}] Processing link: {link}")
+
+    handler = find_resort_handler(resort_id, link)
+    value = run_extract(handler, link)
+    result["modified"] = handler['apply'](item, value, resort_id)
+    record_camera_check(
+      resort_id, item,
+      changed=item.get('video') != video,
+      failed=value is None,
+      now=now,
+    )
   else:
     if video:
       print(f"[{resort_id}] Already has video link: {video}")
@@ -370,16 +622,57 @@ def process_resort(resort, max_workers):
   return modified
 
 
-def generate_video_ld_json(data):
-  print("Generating videos+ld.json...")
-  site_url = "http://ski.atik.kr"
-  now = datetime.datetime.now()
-  future_date = now + datetime.timedelta(days=14)
+SITE_URL = "http://ski.atik.kr"
+SITEMAP_PATH = 'sitemap.xml'
+VIDEO_LD_JSON_PATH = 'videos+ld.json'
+SEO_STATE_PATH = '.seo-state.json'
+
+# Per-file limits from the sitemaps.org protocol.
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+
+VIDEO_LD_EXPIRY = datetime.timedelta(days=14)
+# Regenerate well before the advertised expiry even if nothing changed.
+SEO_MAX_AGE = VIDEO_LD_EXPIRY / 2
+
+
+def seo_fingerprint(data):
+  digest = hashlib.sha256()
+  for resort in data:
+    digest.update(json.dumps([
+      resort.get('id'),
+      resort.get('name', ''),
+      'links' in resort,
+      [[item.get('name', ''), item.get('video')] for item in resort.get('links', [])],
+    ], ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+  return digest.hexdigest()
+
+
+def seo_outputs_stale(fingerprint, now):
+  if not os.path.exists(SITEMAP_PATH) or not os.path.exists(VIDEO_LD_JSON_PATH):
+    return True
+
+  try:
+    with open(SEO_STATE_PATH, 'r', encoding='utf-8') as f:
+      state = json.load(f)
+    generated_at = datetime.datetime.fromisoformat(state['generated_at'])
+  except (OSError, ValueError, KeyError) as e:
+    print(f"No usable {SEO_STATE_PATH}: {e}")
+    return True
+
+  return state.get('fingerprint') != fingerprint or now - generated_at > SEO_MAX_AGE
+
+
+def save_seo_state(fingerprint, now):
+  with open(SEO_STATE_PATH, 'w', encoding='utf-8') as f:
+    json.dump({'fingerprint': fingerprint, 'generated_at': now.isoformat()}, f)
+
+
+def iter_video_objects(data, now):
+  future_date = now + VIDEO_LD_EXPIRY
   formatted_now = now.isoformat() + "+00:00"
   formatted_future = future_date.isoformat() + "+00:00"
 
-  video_objects = []
-
   for resort in data:
     resort_id = resort.get('id')
     resort_name = resort.get('name', '')
@@ -397,12 +690,12 @@ def generate_video_ld_json(data):
       name = f"{resort_name} {camera_name}"
       description = f"스키장 웹캠 - {name}"
 
-      video_object = {
+      yield {
         "@context": "https://schema.org",
         "@type": "VideoObject",
         "contentURL": video_url,
         "description": description,
-        "embedUrl": f"{site_url}/#{resort_id}/{i}",
+        "embedUrl": f"{SITE_URL}/#{resort_id}/{i}",
         "expires": formatted_future,
         "name": name,
         "thumbnailUrl": "/preview.png",
@@ -417,12 +710,144 @@ def generate_video_ld_json(data):
         ]
       }
 
-      video_objects.append(video_object)
 
-  with open('videos+ld.json', 'w', encoding='utf-8') as f:
-    json.dump(video_objects, f, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+def generate_video_ld_json(data, now=None):
+  print("Generating videos+ld.json...")
+  now = now or datetime.datetime.now()
+
+  count = 0
+  tmp_path = VIDEO_LD_JSON_PATH + '.tmp'
+  with open(tmp_path, 'w', encoding='utf-8') as f:
+    f.write('[')
+    for video_object in iter_video_objects(data, now):
+      if count:
+        f.write(',')
+      f.write(json.dumps(video_object, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+      count += 1
+    f.write(']')
+  os.replace(tmp_path, VIDEO_LD_JSON_PATH)
+
+  print(f"Generated videos+ld.json with {count} video objects")
+
+
+def iter_sitemap_urls(data):
+  yield f"{SITE_URL}/", '1.0'
+
+  for resort in data:
+    resort_id = resort.get('id')
+    if not resort_id:
+      continue
+
+    yield f"{SITE_URL}/#{resort_id}", '0.7'
+
+    if 'links' in resort:
+      for i in range(len(resort['links'])):
+        yield f"{SITE_URL}/#{resort_id}/{i}", '0.2'
+
+
+SITEMAP_HEADER = (
+  '<?xml version="1.0" encoding="UTF-8"?>\n'
+  '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+SITEMAP_FOOTER = '</urlset>'
+
 
-  print(f"Generated videos+ld.json with {len(video_objects)} video objects")
+def _sitemap_entry(loc, priority):
+  return (
+    f'  <url>\n'
+    f'  <loc>{escape(loc)}</loc>\n'
+    f'  <priority>{priority}</priority>\n'
+    f'  <changefreq>monthly</changefreq>\n'
+    f'  </url>\n'
+  )
+
+
+def _sitemap_child_path(index):
+  base, _ = os.path.splitext(SITEMAP_PATH)
+  return f"{base}-{index}.xml.gz"
+
+
+def _remove_stale_sitemap_children(first_index):
+  # Children past the ones just written belong to an earlier, larger run.
+  index = first_index
+  while os.path.exists(_sitemap_child_path(index)):
+    os.remove(_sitemap_child_path(index))
+    index += 1
+
+
+def generate_sitemap(data, max_urls=SITEMAP_MAX_URLS, max_bytes=SITEMAP_MAX_BYTES):
+  # Entries are streamed into sitemap.xml. Once a file would exceed the
+  # protocol limits, it is moved into gzipped sitemap-N.xml.gz children and
+  # sitemap.xml is rewritten as a sitemap index pointing at them.
+  print("Generating sitemap.xml...")
+  footer_bytes = len(SITEMAP_FOOTER.encode('utf-8'))
+  tmp_path = SITEMAP_PATH + '.tmp'
+  children = []
+  out_path = tmp_path
+  out = open(out_path, 'w', encoding='utf-8')
+
+  try:
+    out.write(SITEMAP_HEADER)
+    url_count = 0
+    byte_count = len(SITEMAP_HEADER.encode('utf-8'))
+
+    for loc, priority in iter_sitemap_urls(data):
+      entry = _sitemap_entry(loc, priority)
+      entry_bytes = len(entry.encode('utf-8'))
+
+      if url_count >= max_urls or byte_count + entry_bytes + footer_bytes > max_bytes:
+        out.write(SITEMAP_FOOTER)
+        out.close()
+        child_path = _sitemap_child_path(len(children) + 1)
+        if out_path == tmp_path:
+          with open(tmp_path, 'rb') as src, gzip.open(child_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+          os.remove(tmp_path)
+        else:
+          os.replace(out_path, child_path)
+        children.append(child_path)
+
+        out_path = _sitemap_child_path(len(children) + 1) + '.tmp'
+        out = gzip.open(out_path, 'wt', encoding='utf-8')
+        out.write(SITEMAP_HEADER)
+        url_count = 0
+        byte_count = len(SITEMAP_HEADER.encode('utf-8'))
+
+      out.write(entry)
+      url_count += 1
+      byte_count += entry_bytes
+
+    out.write(SITEMAP_FOOTER)
+  finally:
+    out.close()
+
+  if not children:
+    os.replace(tmp_path, SITEMAP_PATH)
+    _remove_stale_sitemap_children(1)
+    print("Generated sitemap.xml successfully")
+    return
+
+  child_path = _sitemap_child_path(len(children) + 1)
+  os.replace(out_path, child_path)
+  children.append(child_path)
+
+  _remove_stale_sitemap_children(len(children) + 1)
+
+  lastmod = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+  with open(tmp_path, 'w', encoding='utf-8') as f:
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for path in children:
+      f.write(
+        f'  <sitemap>\n'
+        f'  <loc>{SITE_URL}/{escape(os.path.basename(path))}</loc>\n'
+        f'  <lastmod>{lastmod}</lastmod>\n'
+        f'  </sitemap>\n'
+      )
+    f.write('</sitemapindex>')
+  os.replace(tmp_path, SITEMAP_PATH)
+
+  print(f"Generated sitemap.xml index with {len(children)} child sitemaps")
 
 
 def main():
@@ -431,6 +856,8 @@ def main():
     with open('links.json', 'r', encoding='utf-8') as f:
       data = json.load(f)
 
+    load_scrape_state()
+
     max_workers_per_resort = 5
     max_total_workers = 20
 
@@ -459,6 +886,7 @@ def main():
       thread.join()
 
     modified = any(resort_results)
+    save_scrape_state(data)
 
     if modified:
       print("Saving updated links.json file...")
@@ -467,49 +895,16 @@ def main():
       print("Saved links.json successfully")
     else:
       print("No changes to links.json")
-
-    generate_video_ld_json(data)
-
-    print("Generating sitemap.xml...")
-    site_url = "http://ski.atik.kr"
-
-    sitemap = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    sitemap += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-
-    sitemap += (
-      f'  <url>\n'
-      f'  <loc>{site_url}/</loc>\n'
-      f'  <priority>1.0</priority>\n'
-      f'  <changefreq>monthly</changefreq>\n'
-      f'  </url>\n'
-    )
-
-    for resort in data:
-      resort_id = resort.get('id')
-      if resort_id:
-        sitemap += (
-          f'  <url>\n'
-          f'  <loc>{site_url}/#{resort_id}</loc>\n'
-          f'  <priority>0.7</priority>\n'
-          f'  <changefreq>monthly</changefreq>\n'
-          f'  </url>\n'
-        )
-
-        if 'links' in resort:
-          for i in range(len(resort['links'])):
-            sitemap += (
-              f'  <url>\n'
-              f'  <loc>{site_url}/#{resort_id}/{i}</loc>\n'
-              f'  <priority>0.2</priority>\n'
-              f'  <changefreq>monthly</changefreq>\n'
-              f'  </url>\n'
-            )
-
-    sitemap += '</urlset>'
-
-    with open('sitemap.xml', 'w', encoding='utf-8') as f:
-      f.write(sitemap)
-    print("Generated sitemap.xml successfully")
+    output_manifest.publish(LINKS_OUTPUT_DIR, ['links.json'])
+
+    now = datetime.datetime.now()
+    fingerprint = seo_fingerprint(data)
+    if seo_outputs_stale(fingerprint, now):
+      generate_video_ld_json(data, now)
+      generate_sitemap(data)
+      save_seo_state(fingerprint, now)
+    else:
+      print("Sitemap and videos+ld.json are up to date")
 
   except Exception as e:
     print(f"Error processing links.json: {e}")
@@ -1292,7 +1292,7 @@ document.addEventListener('DOMContentLoaded', async function () {
         if (weatherData && weatherData.length > 0) {
           updateWeatherDisplay(resortId);
         } else {
-          fetch('weather.json?v=' + new Date().getTime())
+          fetchData('weather.json')
             .then(response => {
               if (!response.ok) {
                 console.warn('Weather data not available');
@@ -2566,11 +2566,33 @@ document.addEventListener('DOMContentLoaded', async function () {
 
   window.addEventListener('hashchange', handleHashChange);
 
+  const DATA_MANIFESTS = {
+    'weather.json': 'weather-data',
+    'weather.grid.json': 'weather-data',
+    'links.json': 'links-data',
+  };
+
+  function fetchData(name) {
+    // The generators publish content-hashed copies that never change, so only
+    // the small manifest is revalidated. Without a manifest the plain file is
+    // fetched with a cache buster as before.
+    const directory = DATA_MANIFESTS[name];
+    return fetch(`${directory}/manifest.json`, { cache: 'no-cache' })
+      .then(response => (response.ok ? response.json() : null))
+      .catch(() => null)
+      .then(manifest => {
+        if (manifest && manifest[name]) {
+          return fetch(`${directory}/${manifest[name]}`);
+        }
+        return fetch(name + '?v=' + new Date().getTime());
+      });
+  }
+
   function initializeApp() {
     let initialWeatherDataPromise = Promise.resolve(null);
 
     if (window.location.hash) {
-      initialWeatherDataPromise = fetch('weather.json?v=' + new Date().getTime())
+      initialWeatherDataPromise = fetchData('weather.json')
         .then(response => {
           if (!response.ok) {
             console.warn('Weather data not available');
@@ -2591,7 +2613,7 @@ document.addEventListener('DOMContentLoaded', async function () {
         });
     }
 
-    fetch('links.json?v=' + new Date().getTime())
+    fetchData('links.json')
       .then(response => {
         if (!response.ok) {
           throw new Error('Network response was not ok');
@@ -2606,7 +2628,7 @@ document.addEventListener('DOMContentLoaded', async function () {
             if (existingWeatherData) {
               return existingWeatherData;
             } else {
-              return fetch('weather.json?v=' + new Date().getTime())
+              return fetchData('weather.json')
                 .then(response => {
                   if (!response.ok) {
                     console.warn('Weather data not available');
@@ -2655,7 +2677,7 @@ document.addEventListener('DOMContentLoaded', async function () {
   }
 
   function loadForecastCharts() {
-    fetch('weather.grid.json?v=' + new Date().getTime())
+    fetchData('weather.grid.json')
       .then(response => {
         if (!response.ok) {
           throw new Error('Failed to load forecast data');
@@ -3157,5 +3179,134 @@ document.addEventListener('DOMContentLoaded', async function () {
     });
   }
 
+  const MAX_WEATHER_DELTAS = 6;
+
+  function applyWeatherDelta(entries, delta) {
+    const removed = new Set(delta.removed || []);
+    const changed = delta.changed || {};
+    const result = [];
+
+    entries.forEach(entry => {
+      const key = `${entry.resort}:${entry.name}`;
+      if (removed.has(key)) return;
+
+      const change = changed[key];
+      if (!change) {
+        result.push(entry);
+        return;
+      }
+
+      const updated = Object.assign({}, entry, change.set || {});
+      (change.unset || []).forEach(field => delete updated[field]);
+      if (change.data) {
+        updated.data = (entry.data || []).slice(change.data.drop).concat(change.data.append);
+      }
+      result.push(updated);
+    });
+
+    return result.concat(delta.added || []);
+  }
+
+  function fetchWeatherWithDeltas(fromHash, toHash) {
+    // Follows weather.delta/<hash>.json from the version we hold to the
+    // latest one; resolves to null when a full download is cheaper or the
+    // chain does not reach back to our version.
+    return fetch('weather.version.json', { cache: 'no-cache' })
+      .then(response => (response.ok ? response.json() : null))
+      .then(version => {
+        if (!version || version.hash !== toHash) return null;
+
+        const start = version.deltas.indexOf(fromHash);
+        if (start === -1 || version.deltas.length - start > MAX_WEATHER_DELTAS) return null;
+
+        return Promise.all(version.deltas.slice(start).map(hash =>
+          fetch(`weather.delta/${hash}.json`).then(response => {
+            if (!response.ok) throw new Error(`Missing weather delta ${hash}`);
+            return response.json();
+          })
+        ));
+      })
+      .then(deltas => {
+        if (!deltas) return null;
+
+        let entries = weatherData;
+        let currentHash = fromHash;
+        for (const delta of deltas) {
+          if (delta.from !== currentHash) return null;
+          entries = applyWeatherDelta(entries, delta);
+          currentHash = delta.to;
+        }
+        return currentHash === toHash ? entries : null;
+      })
+      .catch(error => {
+        console.warn('Falling back to full weather download:', error);
+        return null;
+      });
+  }
+
+  function fetchFullWeather() {
+    return fetch('weather.json', { cache: 'no-cache' })
+      .then(response => {
+        if (!response.ok) {
+          console.warn('Weather data not available');
+          return null;
+        }
+        return response.json();
+      });
+  }
+
+  function refreshWeatherData(fromHash, toHash) {
+    const canPatch = fromHash && toHash && weatherData && weatherData.length > 0;
+    (canPatch ? fetchWeatherWithDeltas(fromHash, toHash) : Promise.resolve(null))
+      .then(patched => patched || fetchFullWeather())
+      .then(weatherResult => {
+        if (!weatherResult) return;
+
+        weatherData = weatherResult;
+        updateAllResortsWeather();
+
+        const resortId = window.location.hash.substring(1).split('/')[0];
+        if (resortId) {
+          updateWeatherDisplay(resortId);
+        }
+      })
+      .catch(error => {
+        console.error('Error refreshing weather data:', error);
+      });
+  }
+
+  function watchOutputChanges() {
+    if (typeof EventSource === 'undefined') return;
+
+    // The first notice per file is the version we already loaded; later
+    // notices with a different hash mean the file was regenerated.
+    const knownHashes = {};
+    const source = new EventSource('events');
+
+    source.addEventListener('change', event => {
+      let notice;
+      try {
+        notice = JSON.parse(event.data);
+      } catch (error) {
+        return;
+      }
+
+      const previousHash = knownHashes[notice.path];
+      knownHashes[notice.path] = notice.hash;
+      if (!previousHash || previousHash === notice.hash) return;
+
+      if (notice.path === 'weather.json') {
+        refreshWeatherData(previousHash, notice.hash);
+      }
+    });
+
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        console.warn('Live weather updates unavailable');
+      }
+    };
+  }
+
   initializeApp();
+  watchOutputChanges();
 });
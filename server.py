@@ -1,10 +1,582 @@
 #!/usr/bin/env python3
+import argparse
+import bisect
+import email.utils
+import hashlib
 import http.server
-import socketserver
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
 
 PORT = 3001
-Handler = http.server.SimpleHTTPRequestHandler
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print(f"Serving at http://localhost:{PORT}")
-    httpd.serve_forever()
\ No newline at end of file
+# Precompressed siblings (main.js.br, weather.json.gz, ...) in preference order.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Content-hashed outputs (weather-data/weather.<hash>.json, ...) never change;
+# the manifest.json next to them is what moves, so it only gets a short TTL.
+HASHED_PATTERN = re.compile(r'\.[0-9a-f]{16}\.[^./]+$')
+DATA_MANIFESTS = ('/weather-data/manifest.json', '/links-data/manifest.json')
+DATA_MANIFEST_MAX_AGE = 30
+
+EVENTS_PATH = '/events'
+WATCHED_FILES = ('weather.json', 'weather.grid.json', 'links.json')
+WATCH_INTERVAL = 1.0
+SSE_HEARTBEAT = 15
+
+METRICS_PATH = '/metrics'
+# Seconds; static files should land in the first few buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRICS_MAX_PATHS = 256
+HASH_LABEL_PATTERN = re.compile(r'(?<![0-9a-f])[0-9a-f]{16}(?![0-9a-f])')
+
+ASSET_CACHE_BYTES = 64 * 1024 * 1024
+ASSET_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+class AssetCache:
+    # Keeps the bytes of small files (and their .br/.gz siblings, which are
+    # cached under their own paths) in an LRU bounded by total size. An entry
+    # is only served while the file's mtime and size still match, so outputs
+    # rewritten by the fetch scripts are picked up on the next request. The
+    # key is the translated file path, so ?v= cache-busters share one entry.
+    def __init__(self, max_bytes=ASSET_CACHE_BYTES, max_entry_bytes=ASSET_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and (entry[0].st_mtime_ns, entry[0].st_size) == (stat.st_mtime_ns, stat.st_size):
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        if stat.st_size > self.max_entry_bytes:
+            return stat, None
+
+        with open(path, 'rb') as f:
+            body = f.read()
+            stat = os.fstat(f.fileno())
+        if len(body) != stat.st_size:
+            # The file was rewritten while being read; serve it from disk.
+            return stat, None
+
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old:
+                self.size -= len(old[1])
+            self.entries[path] = (stat, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return stat, body
+
+
+class Metrics:
+    # Request counters and latency histograms per path, rendered in the
+    # Prometheus text format. Paths drop their query string and fold content
+    # hashes into {hash}; past max_paths distinct paths, new ones are counted
+    # as "other" so scanners cannot grow the label set without bound. An
+    # observation is one bisect and a few additions under a lock.
+    def __init__(self, buckets=LATENCY_BUCKETS, max_paths=METRICS_MAX_PATHS):
+        self.buckets = buckets
+        self.max_paths = max_paths
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.bytes_sent = {}
+        self.in_flight = 0
+        self.events_clients = 0
+
+    def label(self, path):
+        return HASH_LABEL_PATTERN.sub('{hash}', path.partition('?')[0])
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, path, status, seconds, size, timed=True):
+        path = self.label(path)
+        with self.lock:
+            self.in_flight -= 1
+            if path not in self.latency and len(self.latency) >= self.max_paths:
+                path = 'other'
+            histogram = self.latency.get(path)
+            if histogram is None:
+                # Per-bucket counts, then the +Inf count and the sum.
+                histogram = self.latency[path] = [0] * (len(self.buckets) + 1) + [0.0]
+            if timed:
+                histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram[-1] += seconds
+            key = (path, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent[path] = self.bytes_sent.get(path, 0) + size
+
+    def events_connected(self, delta):
+        with self.lock:
+            self.events_clients += delta
+
+    def render(self, assets=None):
+        with self.lock:
+            requests = dict(self.requests)
+            latency = {path: list(counts) for path, counts in self.latency.items()}
+            bytes_sent = dict(self.bytes_sent)
+            in_flight = self.in_flight
+            events_clients = self.events_clients
+
+        lines = [
+            '# HELP slopes_http_requests_total Requests handled, by path and status code.',
+            '# TYPE slopes_http_requests_total counter',
+        ]
+        for (path, status), count in sorted(requests.items()):
+            lines.append(f'slopes_http_requests_total{{path="{escape_label(path)}",code="{status}"}} {count}')
+
+        lines += [
+            '# HELP slopes_http_request_duration_seconds Time from parsing the request line to the last byte written.',
+            '# TYPE slopes_http_request_duration_seconds histogram',
+        ]
+        for path, counts in sorted(latency.items()):
+            label = escape_label(path)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'slopes_http_request_duration_seconds_bucket{{path="{label}",le="{bound}"}} {cumulative}')
+            cumulative += counts[len(self.buckets)]
+            lines.append(f'slopes_http_request_duration_seconds_bucket{{path="{label}",le="+Inf"}} {cumulative}')
+            lines.append(f'slopes_http_request_duration_seconds_sum{{path="{label}"}} {counts[-1]:.6f}')
+            lines.append(f'slopes_http_request_duration_seconds_count{{path="{label}"}} {cumulative}')
+
+        lines += [
+            '# HELP slopes_http_response_bytes_total Response body bytes sent, by path.',
+            '# TYPE slopes_http_response_bytes_total counter',
+        ]
+        for path, size in sorted(bytes_sent.items()):
+            lines.append(f'slopes_http_response_bytes_total{{path="{escape_label(path)}"}} {size}')
+
+        lines += [
+            '# HELP slopes_http_requests_in_flight Requests currently being handled.',
+            '# TYPE slopes_http_requests_in_flight gauge',
+            f'slopes_http_requests_in_flight {in_flight}',
+            '# HELP slopes_events_clients Open server-sent events connections.',
+            '# TYPE slopes_events_clients gauge',
+            f'slopes_events_clients {events_clients}',
+            '# HELP slopes_threads Live threads, one per open connection plus the server.',
+            '# TYPE slopes_threads gauge',
+            f'slopes_threads {threading.active_count()}',
+        ]
+
+        if assets is not None:
+            with assets.lock:
+                hits, misses, evictions = assets.hits, assets.misses, assets.evictions
+                entries, size = len(assets.entries), assets.size
+            lookups = hits + misses
+            lines += [
+                '# HELP slopes_asset_cache_hits_total Asset cache lookups served from memory.',
+                '# TYPE slopes_asset_cache_hits_total counter',
+                f'slopes_asset_cache_hits_total {hits}',
+                '# HELP slopes_asset_cache_misses_total Asset cache lookups that went to disk.',
+                '# TYPE slopes_asset_cache_misses_total counter',
+                f'slopes_asset_cache_misses_total {misses}',
+                '# HELP slopes_asset_cache_evictions_total Entries evicted to stay within the size limit.',
+                '# TYPE slopes_asset_cache_evictions_total counter',
+                f'slopes_asset_cache_evictions_total {evictions}',
+                '# HELP slopes_asset_cache_hit_ratio Hits over lookups since start.',
+                '# TYPE slopes_asset_cache_hit_ratio gauge',
+                f'slopes_asset_cache_hit_ratio {hits / lookups if lookups else 0:.6f}',
+                '# HELP slopes_asset_cache_entries Files held in memory.',
+                '# TYPE slopes_asset_cache_entries gauge',
+                f'slopes_asset_cache_entries {entries}',
+                '# HELP slopes_asset_cache_bytes Bytes held in memory.',
+                '# TYPE slopes_asset_cache_bytes gauge',
+                f'slopes_asset_cache_bytes {size}',
+            ]
+
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ChangeFeed:
+    # Polls the generated outputs and bumps a version whenever one of them
+    # changes content. SSE clients block on the condition until then, so an
+    # idle page costs one open connection and a heartbeat comment.
+    def __init__(self, directory, names=WATCHED_FILES, interval=WATCH_INTERVAL):
+        self.directory = directory
+        self.names = names
+        self.interval = interval
+        self.files = {}
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def start(self):
+        self.poll()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Change feed poll failed: {e}")
+
+    def poll(self):
+        for name in self.names:
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            current = self.files.get(name)
+            if current and (current['mtime_ns'], current['size']) == (stat.st_mtime_ns, stat.st_size):
+                continue
+
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:16]
+            with self.condition:
+                changed = not current or current['hash'] != digest
+                self.files[name] = {
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'hash': digest,
+                }
+                if changed:
+                    self.version += 1
+                    self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return self.version, {name: dict(info) for name, info in self.files.items()}
+
+    def wait(self, version, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class StaticHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def parse_request(self):
+        # Timing starts once a request line has arrived, so idle keep-alive
+        # connections waiting for the next request are not counted.
+        self._started = time.perf_counter()
+        self._status = None
+        self._body_bytes = 0
+        self.path = ''
+        if self.server.metrics:
+            self.server.metrics.begin()
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self._started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._started is not None and self.server.metrics:
+                path = self.path or 'invalid'
+                self.server.metrics.end(
+                    path,
+                    self._status or 'aborted',
+                    time.perf_counter() - self._started,
+                    self._body_bytes,
+                    timed=path.partition('?')[0] != EVENTS_PATH,
+                )
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length' and self.command != 'HEAD':
+            self._body_bytes = int(value)
+        super().send_header(keyword, value)
+
+    def do_GET(self):
+        path = self.path.partition('?')[0]
+        if path == EVENTS_PATH and self.server.feed:
+            self.send_events()
+            return
+        if path == METRICS_PATH and self.server.metrics:
+            self.send_metrics()
+            return
+        super().do_GET()
+
+    def send_metrics(self):
+        body = self.server.metrics.render(self.server.assets)
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self):
+        # Sends one `change` event per watched file on connect and again
+        # whenever its content hash changes. The body is unbounded, so the
+        # connection is closed when the client goes away.
+        self.close_connection = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+
+        feed = self.server.feed
+        metrics = self.server.metrics
+        if metrics:
+            metrics.events_connected(1)
+        sent = {}
+        try:
+            self.wfile.write(f"retry: {SSE_HEARTBEAT * 1000}\n\n".encode('utf-8'))
+            while True:
+                version, files = feed.snapshot()
+                for name, info in files.items():
+                    if sent.get(name) == info['hash']:
+                        continue
+                    notice = {
+                        'path': name,
+                        'hash': info['hash'],
+                        'size': info['size'],
+                        'mtime': info['mtime_ns'] // 1_000_000_000,
+                    }
+                    self.wfile.write(
+                        f"event: change\nid: {info['hash']}\ndata: {json.dumps(notice)}\n\n".encode('utf-8')
+                    )
+                    sent[name] = info['hash']
+                if feed.wait(version, SSE_HEARTBEAT) == version:
+                    self.wfile.write(b': ping\n\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            if metrics:
+                metrics.events_connected(-1)
+
+    def send_head(self):
+        self._range = None
+        self._payload = None
+        path = self.translate_path(self.path)
+
+        if os.path.isdir(path):
+            if not self.path.partition('?')[0].endswith('/'):
+                return super().send_head()
+            for index in ('index.html', 'index.htm'):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                return super().send_head()
+
+        if path.endswith('/') or not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+
+        encoding, file_path = self.pick_variant(path)
+        try:
+            stat, body = self.server.assets.load(file_path)
+            f = io.BytesIO() if body is not None else open(file_path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+
+        try:
+            if body is None:
+                stat = os.fstat(f.fileno())
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+            last_modified = self.date_time_string(int(stat.st_mtime))
+            cache_control = self.cache_control(path)
+
+            if self.not_modified(etag, stat.st_mtime):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                if cache_control:
+                    self.send_header('Cache-Control', cache_control)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                f.close()
+                return None
+
+            start, length = 0, stat.st_size
+            status = HTTPStatus.OK
+            range_header = self.headers.get('Range')
+            if range_header and self.headers.get('If-Range', etag) in (etag, last_modified):
+                byte_range = self.parse_range(range_header, stat.st_size)
+                if byte_range is None:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header('Content-Range', f'bytes */{stat.st_size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    f.close()
+                    return None
+                if byte_range != (0, stat.st_size):
+                    start, length = byte_range
+                    status = HTTPStatus.PARTIAL_CONTENT
+
+            self.send_response(status)
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Length', str(length))
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header('Content-Range', f'bytes {start}-{start + length - 1}/{stat.st_size}')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if self.has_variants(path):
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Accept-Ranges', 'bytes')
+            if cache_control:
+                self.send_header('Cache-Control', cache_control)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            if body is not None:
+                self._payload = memoryview(body)[start:start + length]
+            else:
+                self._range = (start, length)
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def cache_control(self, path):
+        if HASHED_PATTERN.search(os.path.basename(path)):
+            return 'public, max-age=31536000, immutable'
+        if self.path.partition('?')[0] in DATA_MANIFESTS:
+            return f'public, max-age={DATA_MANIFEST_MAX_AGE}'
+        return None
+
+    def pick_variant(self, path):
+        # Use a precompressed sibling only if it is at least as new as the
+        # original, so a stale .br/.gz never shadows a regenerated file.
+        accepted = self.headers.get('Accept-Encoding', '')
+        accepted = {token.split(';')[0].strip() for token in accepted.split(',')}
+        mtime = os.stat(path).st_mtime
+        for encoding, suffix in ENCODINGS:
+            variant = path + suffix
+            if encoding in accepted and os.path.isfile(variant) and os.stat(variant).st_mtime >= mtime:
+                return encoding, variant
+        return None, path
+
+    def has_variants(self, path):
+        return any(os.path.isfile(path + suffix) for _, suffix in ENCODINGS)
+
+    def not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    def parse_range(self, header, size):
+        # Single byte ranges only; anything else is served as a full 200.
+        match = RANGE_PATTERN.match(header.strip())
+        if not match or not any(match.groups()):
+            return (0, size)
+
+        first, last = match.groups()
+        if not first:
+            length = min(int(last), size)
+            return (size - length, length) if length else None
+
+        start = int(first)
+        if start >= size:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+        if end < start:
+            return (0, size)
+        return (start, end - start + 1)
+
+    def copyfile(self, source, outputfile):
+        if self._payload is not None:
+            try:
+                outputfile.write(self._payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            return
+
+        if self._range is None:
+            return super().copyfile(source, outputfile)
+
+        start, length = self._range
+        try:
+            self.connection.sendfile(source, offset=start, count=length)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class StaticServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, handler, assets, feed=None, metrics=None):
+        super().__init__(address, handler)
+        self.assets = assets
+        self.feed = feed
+        self.metrics = metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the site for local and staging runs')
+    parser.add_argument('--bind', default='')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--directory', default=os.getcwd())
+    parser.add_argument(
+        '--cache-mb', type=int, default=ASSET_CACHE_BYTES // 2**20,
+        help='in-memory asset cache size (0 disables it)',
+    )
+    parser.add_argument(
+        '--no-events', action='store_true',
+        help=f'disable the {EVENTS_PATH} server-sent events endpoint',
+    )
+    parser.add_argument(
+        '--no-metrics', action='store_true',
+        help=f'disable request metrics and the {METRICS_PATH} endpoint',
+    )
+    args = parser.parse_args()
+
+    handler = partial(StaticHandler, directory=args.directory)
+    assets = AssetCache(max_bytes=args.cache_mb * 2**20)
+    feed = None
+    if not args.no_events:
+        feed = ChangeFeed(args.directory)
+        feed.start()
+
+    metrics = None if args.no_metrics else Metrics()
+
+    with StaticServer((args.bind, args.port), handler, assets, feed, metrics) as httpd:
+        print(f"Serving at http://localhost:{args.port}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
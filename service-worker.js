@@ -1,4 +1,4 @@
-const CACHE_NAME = 'slopes-cam-v5';
+const CACHE_NAME = 'slopes-cam-v7';
 const urlsToCache = [
   './',
   './index.html',
@@ -25,6 +25,22 @@ const urlsToCache = [
   './vivaldi.js',
 ];
 
+// Mutable data that must always come from the network: the manifests that
+// point at content-hashed data files, the delta chain head and the change
+// feed.
+const networkOnlyPaths = [
+  '/events',
+  '/weather.json',
+  '/weather.version.json',
+  '/weather-data/manifest.json',
+  '/links-data/manifest.json',
+];
+
+// Content-hashed data copies and weather deltas. A new one is published
+// every few minutes, so they would pile up in CACHE_NAME forever; the HTTP
+// cache already keeps them as immutable, so the worker leaves them alone.
+const uncachedPathPattern = /\/((weather|links)-data\/[^/]+\.[0-9a-f]{16}\.[a-z]+|weather\.delta\/[0-9a-f]+\.json)$/;
+
 const externalResources = [
   'https://cdn.jsdelivr.net/npm/bootstrap@5.3.5/dist/css/bootstrap.min.css',
   'https://cdn.jsdelivr.net/npm/video.js@8.23.3/dist/video-js.min.css',
@@ -77,6 +93,12 @@ self.addEventListener('fetch', event => {
     return;
   }
 
+  if (requestUrl.origin === self.location.origin &&
+      (networkOnlyPaths.some(path => requestUrl.pathname.endsWith(path)) ||
+       uncachedPathPattern.test(requestUrl.pathname))) {
+    return;
+  }
+
   event.respondWith(
     caches.match(event.request)
       .then(response => {
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, namedtuple
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit
+
+PORT = 3002
+PROXY_PREFIX = '/stream_proxy/'
+STATS_PATH = '/stream_proxy_stats'
+
+# Same allow-list as the nginx /stream_proxy/ location in SETUP.md.
+ALLOWED_HOSTS = {
+    'konjiam.live.cdn.cloudn.co.kr',
+    '59.30.12.195:1935',
+    '118.46.149.144:8080',
+    'sn.rtsp.me',
+}
+
+USER_AGENT = (
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/135.0.0.0 Safari/537.36'
+)
+UPSTREAM_TIMEOUT = 10
+
+# Playlists are reused for half their target duration (clients reload about
+# once per target duration). Segments are immutable once published and stay
+# listed for a few target durations, so they are kept for a multiple of it.
+PLAYLIST_TTL_FRACTION = 0.5
+MIN_PLAYLIST_TTL = 1.0
+SEGMENT_TTL_TARGETS = 12
+DEFAULT_TARGET_DURATION = 6.0
+
+# Playlist state is keyed by the full upstream URL, and rtsp.me rotates
+# token query strings, so both maps are LRUs capped by entry count.
+MAX_PLAYLISTS = 1024
+MAX_PLAYLIST_DIRS = 1024
+
+MEMORY_CACHE_BYTES = 256 * 1024 * 1024
+DISK_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+MAX_HEADER_LINES = 100
+URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+TARGET_DURATION = re.compile(rb'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)')
+MEDIA_SEQUENCE = re.compile(rb'#EXT-X-MEDIA-SEQUENCE:\s*(\d+)')
+
+Upstream = namedtuple('Upstream', 'status content_type body')
+
+
+def parse_proxy_target(target):
+    path, _, query = target.partition('?')
+    if not path.startswith(PROXY_PREFIX):
+        return None
+
+    scheme, _, remainder = path[len(PROXY_PREFIX):].partition('/')
+    netloc, _, upstream_path = remainder.partition('/')
+    if scheme not in ('http', 'https') or not netloc:
+        return None
+
+    url = f"{scheme}://{netloc}/{upstream_path}"
+    if query:
+        url = f"{url}?{query}"
+    return url, dict(parse_qsl(query, keep_blank_values=True)).get('ip')
+
+
+def is_playlist(url, upstream):
+    return (
+        urlsplit(url).path.endswith('.m3u8')
+        or 'mpegurl' in upstream.content_type.lower()
+        or upstream.body.startswith(b'#EXTM3U')
+    )
+
+
+def playlist_target_duration(body):
+    match = TARGET_DURATION.search(body)
+    return float(match.group(1)) if match else None
+
+
+def playlist_media_sequence(body):
+    match = MEDIA_SEQUENCE.search(body)
+    return int(match.group(1)) if match else 0
+
+
+def status_phrase(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return 'Unknown'
+
+
+class SegmentCache:
+    # Byte-bounded LRU in memory backed by an optional byte-bounded LRU on
+    # disk. Disk entries store the content type on the first line and keep
+    # their expiry time in the file mtime, so the index survives restarts.
+    def __init__(self, memory_bytes=MEMORY_CACHE_BYTES, disk_dir=None, disk_bytes=DISK_CACHE_BYTES):
+        self.memory_limit = memory_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_dir = disk_dir
+        self.disk_limit = disk_bytes
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.stats = dict.fromkeys((
+            'memory_hits', 'disk_hits', 'misses', 'expired',
+            'memory_evictions', 'disk_evictions', 'disk_errors',
+        ), 0)
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _disk_path(self, name):
+        return os.path.join(self.disk_dir, name[:2], name)
+
+    def _load_disk_index(self):
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                if stat.st_mtime <= now:
+                    os.remove(path)
+                    continue
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for expires, name, size in sorted(entries):
+            self.disk[name] = (expires, size)
+            self.disk_bytes += size
+
+    def _remember(self, key, expires, upstream):
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key)[1].body)
+        self.memory[key] = (expires, upstream)
+        self.memory_bytes += len(upstream.body)
+        while self.memory_bytes > self.memory_limit and self.memory:
+            _, (_, evicted) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted.body)
+            self.stats['memory_evictions'] += 1
+
+    def _read_disk(self, name):
+        with open(self._disk_path(name), 'rb') as f:
+            content_type = f.readline().decode('latin-1').rstrip('\n')
+            return Upstream(200, content_type, f.read())
+
+    def _write_disk(self, name, expires, upstream):
+        path = self._disk_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(upstream.content_type.encode('latin-1', errors='replace') + b'\n')
+            f.write(upstream.body)
+        os.utime(tmp_path, (expires, expires))
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _drop_disk(self, name):
+        # A concurrent put() may have evicted the entry while a read of it
+        # was awaiting the disk.
+        entry = self.disk.pop(name, None)
+        if entry is None:
+            return
+        self.disk_bytes -= entry[1]
+        try:
+            os.remove(self._disk_path(name))
+        except OSError:
+            self.stats['disk_errors'] += 1
+
+    async def get(self, key):
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry:
+            if entry[0] > now:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return entry[1]
+            self.memory_bytes -= len(self.memory.pop(key)[1].body)
+            self.stats['expired'] += 1
+
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        disk_entry = self.disk.get(name)
+        if disk_entry:
+            if disk_entry[0] > now:
+                try:
+                    upstream = await asyncio.to_thread(self._read_disk, name)
+                except OSError:
+                    self.stats['disk_errors'] += 1
+                    self._drop_disk(name)
+                else:
+                    if name in self.disk:
+                        self.disk.move_to_end(name)
+                    self._remember(key, disk_entry[0], upstream)
+                    self.stats['disk_hits'] += 1
+                    return upstream
+            else:
+                self._drop_disk(name)
+                self.stats['expired'] += 1
+
+        self.stats['misses'] += 1
+        return None
+
+    async def put(self, key, upstream, ttl):
+        expires = time.time() + ttl
+        self._remember(key, expires, upstream)
+        if not self.disk_dir:
+            return
+
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        try:
+            size = await asyncio.to_thread(self._write_disk, name, expires, upstream)
+        except OSError as e:
+            print(f"[stream_proxy] Disk cache write failed for {key}: {e}")
+            self.stats['disk_errors'] += 1
+            return
+
+        if name in self.disk:
+            self.disk_bytes -= self.disk.pop(name)[1]
+        self.disk[name] = (expires, size)
+        self.disk_bytes += size
+        while self.disk_bytes > self.disk_limit and self.disk:
+            self._drop_disk(next(iter(self.disk)))
+            self.stats['disk_evictions'] += 1
+
+    def snapshot(self):
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return {
+            **self.stats,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory_bytes,
+            'disk_entries': len(self.disk),
+            'disk_bytes': self.disk_bytes,
+        }
+
+
+class StreamProxy:
+    def __init__(self, allowed_hosts=ALLOWED_HOSTS, timeout=UPSTREAM_TIMEOUT, cache=None):
+        self.allowed_hosts = set(allowed_hosts)
+        self.timeout = timeout
+        self.cache = cache or SegmentCache()
+        self.inflight = {}
+        # Playlist URL -> (expires, media sequence, fetched at, upstream).
+        # Kept apart from the segment cache since there is one per camera.
+        self.playlists = OrderedDict()
+        # Playlist directory -> target duration, used for segment TTLs.
+        self.target_durations = OrderedDict()
+        self.playlist_evictions = 0
+        self.upstream_fetches = 0
+        self.stale_playlists = 0
+
+    def proxied_url(self, url, proxy_ip):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or parts.netloc not in self.allowed_hosts:
+            return url
+
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        if proxy_ip and 'ip' not in query:
+            query['ip'] = proxy_ip
+        new_query = urlencode(query, doseq=True)
+
+        proxy_url = f"{PROXY_PREFIX}{parts.scheme}/{parts.netloc}{parts.path}"
+        return f"{proxy_url}?{new_query}" if new_query else proxy_url
+
+    def rewrite_playlist(self, body, playlist_url, proxy_ip):
+        def rewrite(uri):
+            return self.proxied_url(urljoin(playlist_url, uri), proxy_ip)
+
+        lines = []
+        for line in body.decode('utf-8', errors='replace').splitlines():
+            stripped = line.strip()
+            if stripped and not stripped.startswith('#'):
+                line = rewrite(stripped)
+            elif 'URI="' in line:
+                line = URI_ATTRIBUTE.sub(lambda m: f'URI="{rewrite(m.group(1))}"', line)
+            lines.append(line)
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _fetch_blocking(self, url):
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return Upstream(response.status, response.headers.get('Content-Type', ''), response.read())
+        except urllib.error.HTTPError as e:
+            return Upstream(e.code, e.headers.get('Content-Type', ''), e.read())
+
+    def segment_ttl(self, url):
+        directory = url.split('?', 1)[0].rsplit('/', 1)[0]
+        target = self.target_durations.get(directory)
+        if target is None:
+            return DEFAULT_TARGET_DURATION * SEGMENT_TTL_TARGETS
+        self.target_durations.move_to_end(directory)
+        return target * SEGMENT_TTL_TARGETS
+
+    def _remember_bounded(self, mapping, key, value, limit):
+        mapping[key] = value
+        mapping.move_to_end(key)
+        evicted = 0
+        while len(mapping) > limit:
+            mapping.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def store_playlist(self, url, upstream):
+        # A lagging CDN edge can hand back an older playlist than the one
+        # already served. Keep the newer one unless it has outlived a few
+        # target durations, which means the stream restarted its sequence.
+        now = time.time()
+        target = playlist_target_duration(upstream.body) or DEFAULT_TARGET_DURATION
+        sequence = playlist_media_sequence(upstream.body)
+        directory = url.split('?', 1)[0].rsplit('/', 1)[0]
+        self._remember_bounded(self.target_durations, directory, target, MAX_PLAYLIST_DIRS)
+
+        current = self.playlists.get(url)
+        if current and sequence < current[1] and now - current[2] < 3 * target:
+            self.stale_playlists += 1
+            return current[3]
+
+        ttl = max(MIN_PLAYLIST_TTL, target * PLAYLIST_TTL_FRACTION)
+        self.playlist_evictions += self._remember_bounded(
+            self.playlists, url, (now + ttl, sequence, now, upstream), MAX_PLAYLISTS)
+        return upstream
+
+    async def _fetch_upstream(self, url):
+        self.upstream_fetches += 1
+        try:
+            upstream = await asyncio.to_thread(self._fetch_blocking, url)
+        except Exception as e:
+            print(f"[stream_proxy] Upstream error for {url}: {e}")
+            return Upstream(502, 'text/plain', b'Bad gateway\n')
+
+        if upstream.status != 200:
+            return upstream
+        if is_playlist(url, upstream):
+            return self.store_playlist(url, upstream)
+
+        await self.cache.put(url, upstream, self.segment_ttl(url))
+        return upstream
+
+    async def fetch(self, url):
+        # Concurrent requests for the same upstream URL share one in-flight
+        # fetch; shield() keeps a disconnecting viewer from cancelling it.
+        playlist = self.playlists.get(url)
+        if playlist and playlist[0] > time.time():
+            self.playlists.move_to_end(url)
+            return playlist[3]
+
+        if not playlist and not urlsplit(url).path.endswith('.m3u8'):
+            cached = await self.cache.get(url)
+            if cached:
+                return cached
+
+        task = self.inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_upstream(url))
+            self.inflight[url] = task
+            task.add_done_callback(lambda _: self.inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            'segments': self.cache.snapshot(),
+            'playlists': len(self.playlists),
+            'playlist_dirs': len(self.target_durations),
+            'playlist_evictions': self.playlist_evictions,
+            'stale_playlists': self.stale_playlists,
+            'upstream_fetches': self.upstream_fetches,
+            'inflight': len(self.inflight),
+        }
+
+    async def respond(self, target):
+        if target.partition('?')[0] == STATS_PATH:
+            return 200, 'application/json', json.dumps(self.stats()).encode('utf-8'), 'no-store'
+
+        parsed = parse_proxy_target(target)
+        if not parsed:
+            return 404, 'text/plain', b'Not found\n', 'no-store'
+
+        url, proxy_ip = parsed
+        if urlsplit(url).netloc not in self.allowed_hosts:
+            return 403, 'text/plain', b'Forbidden\n', 'no-store'
+
+        upstream = await self.fetch(url)
+        if upstream.status != 200:
+            return upstream.status, upstream.content_type or 'text/plain', upstream.body, 'no-store'
+
+        if is_playlist(url, upstream):
+            body = self.rewrite_playlist(upstream.body, url, proxy_ip)
+            return 200, 'application/vnd.apple.mpegurl', body, 'max-age=1'
+
+        return 200, upstream.content_type or 'application/octet-stream', upstream.body, 'max-age=60'
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get('content-length', '0')
+                if length.isdigit() and int(length):
+                    await reader.readexactly(int(length))
+
+                if method not in ('GET', 'HEAD'):
+                    status, content_type, body, cache_control = 405, 'text/plain', b'Method not allowed\n', 'no-store'
+                else:
+                    status, content_type, body, cache_control = await self.respond(target)
+
+                keep_alive = (
+                    version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                )
+                writer.write(
+                    f"HTTP/1.1 {status} {status_phrase(status)}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Cache-Control: {cache_control}\r\n"
+                    f"Access-Control-Allow-Origin: *\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    f"\r\n".encode('latin-1')
+                )
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, proxy):
+    server = await asyncio.start_server(proxy.handle_client, host, port)
+    print(f"Proxying {PROXY_PREFIX} at http://{host or 'localhost'}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HLS proxy for /stream_proxy/ URLs')
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument(
+        '--allow-host', action='append', default=[],
+        help='extra upstream host[:port] to allow (e.g. a local test upstream)',
+    )
+    parser.add_argument('--timeout', type=float, default=UPSTREAM_TIMEOUT)
+    parser.add_argument('--cache-memory-mb', type=int, default=MEMORY_CACHE_BYTES // 2**20)
+    parser.add_argument('--cache-dir', help='enable the disk segment cache in this directory')
+    parser.add_argument('--cache-disk-mb', type=int, default=DISK_CACHE_BYTES // 2**20)
+    args = parser.parse_args()
+
+    cache = SegmentCache(
+        memory_bytes=args.cache_memory_mb * 2**20,
+        disk_dir=args.cache_dir,
+        disk_bytes=args.cache_disk_mb * 2**20,
+    )
+    proxy = StreamProxy(ALLOWED_HOSTS | set(args.allow_host), args.timeout, cache)
+    try:
+        asyncio.run(serve(args.host, args.port, proxy))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
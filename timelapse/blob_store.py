@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+class BlobStore:
+  # Content-addressed frame files: <root>/<aa>/<bb>/<sha256>.<format>.
+  # Two levels of two hex characters keep every directory small (65536
+  # leaves), and identical frames map to the same file, so a frozen camera
+  # stores its picture once. Files are immutable once written, which lets a
+  # web server send them straight off disk with a long cache lifetime.
+  def __init__(self, root: Path):
+    self.root = Path(root)
+
+  @staticmethod
+  def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+  def path_for(self, digest: str, image_format: str) -> Path:
+    return self.root / digest[:2] / digest[2:4] / f"{digest}.{image_format}"
+
+  def put(self, data: bytes, image_format: str, digest: Optional[str] = None) -> str:
+    digest = digest or self.digest(data)
+    path = self.path_for(digest, image_format)
+    if path.exists():
+      # Refreshing the mtime tells the retention sweep the file is in use
+      # again, even if the rows that first referenced it are gone.
+      try:
+        os.utime(path)
+        return digest
+      except FileNotFoundError:
+        pass
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file in the same directory, fsync it, rename it into
+    # place and fsync the directory, so a crash leaves either no file or a
+    # complete one, never a torn frame under a valid hash.
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=path.parent)
+    try:
+      with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+      os.replace(tmp_path, path)
+    except BaseException:
+      try:
+        os.unlink(tmp_path)
+      except FileNotFoundError:
+        pass
+      raise
+    fsync_dir(path.parent)
+    return digest
+
+  def get(self, digest: str, image_format: str) -> bytes:
+    return self.path_for(digest, image_format).read_bytes()
+
+
+def fsync_dir(path: Path):
+  try:
+    fd = os.open(path, os.O_RDONLY)
+  except OSError:
+    return
+  try:
+    os.fsync(fd)
+  except OSError:
+    # Some filesystems (and Windows) do not support fsync on directories.
+    pass
+  finally:
+    os.close(fd)
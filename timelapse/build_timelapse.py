@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime as dt
+import io
+import json
+import logging
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pymysql
+from PIL import Image
+
+from blob_store import BlobStore
+from cron_capture import connect_mysql, load_config, resolve_path
+
+DEFAULT_CLIP_DIR = Path(__file__).with_name("clips")
+OUTPUT_FORMATS = ("mp4", "hls")
+CODECS = {
+  "h264": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p"],
+  "av1": ["-c:v", "libaom-av1", "-cpu-used", "8", "-row-mt", "1", "-crf", "34", "-b:v", "0", "-pix_fmt", "yuv420p"],
+}
+HLS_SEGMENT_SECONDS = 4
+
+Frame = Tuple[dt.datetime, bytes]
+
+
+def load_builder_config() -> Dict[str, object]:
+  config = load_config()
+  codec = os.getenv("CLIP_CODEC", "h264").lower()
+  if codec not in CODECS:
+    raise SystemExit(f"Unknown CLIP_CODEC '{codec}' (expected {' or '.join(CODECS)})")
+  config.update({
+    "clip_dir": resolve_path(os.getenv("CLIP_DIR", DEFAULT_CLIP_DIR)),
+    "clip_fps": int(os.getenv("CLIP_FPS", "24")),
+    "clip_codec": codec,
+    # Spilled rows are replayed by a later capture run, so a day's frames
+    # can still arrive after it is over.
+    "clip_complete_grace": dt.timedelta(seconds=int(os.getenv("CLIP_COMPLETE_GRACE_SECONDS", "21600"))),
+  })
+  return config
+
+
+class FrameSource:
+  # Streams one camera's stored frames in capture order. The rows come from
+  # an unbuffered (server-side) cursor, so only the current row is held in
+  # memory however long the range is. Rows without image_bytes (blob
+  # storage, or near-duplicates referencing an earlier frame) are resolved
+  # by image_hash: the previous frame, then the blob store, then a lookup
+  # on a second connection, since the streaming one is busy until the
+  # result set is drained.
+  #
+  # Rows are committed by a single writer, so ids grow in commit order and
+  # the largest id seen is a watermark for what a clip already contains.
+  # A frame spilled and replayed later gets a new id but an older
+  # captured_at, which is how a late frame is recognised.
+  def __init__(self, config: Dict[str, object]):
+    self.config = config
+    self.table = config["mysql_table"]
+    self.blobs = BlobStore(config["blob_dir"])
+    self.lookup = None
+
+  def frames(
+    self, resort_id: str, slope_name: str, start: dt.datetime, end: dt.datetime, max_id: Optional[int] = None
+  ) -> Iterator[Frame]:
+    sql = f"""
+      SELECT captured_at, image_format, image_bytes, image_hash
+      FROM `{self.table}`
+      WHERE resort_id = %s AND slope_name = %s
+        AND captured_at >= %s AND captured_at < %s
+        {"AND id <= %s" if max_id is not None else ""}
+      ORDER BY captured_at
+    """
+    params = (resort_id, slope_name, start, end) + ((max_id,) if max_id is not None else ())
+    connection = connect_mysql(self.config)
+    previous: Tuple[Optional[str], Optional[bytes]] = (None, None)
+    try:
+      with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute(sql, params)
+        for row in cursor:
+          image_bytes = row["image_bytes"]
+          if image_bytes is None:
+            if row["image_hash"] == previous[0]:
+              image_bytes = previous[1]
+            else:
+              image_bytes = self.resolve(row["image_hash"], row["image_format"])
+          if image_bytes is None:
+            logging.warning("Frame at %s has no image data; skipping", row["captured_at"])
+            continue
+          previous = (row["image_hash"], image_bytes)
+          yield row["captured_at"], image_bytes
+    finally:
+      connection.close()
+
+  def query_one(self, sql: str, params: Tuple) -> Optional[Dict[str, object]]:
+    if self.lookup is None:
+      self.lookup = connect_mysql(self.config)
+    with self.lookup.cursor() as cursor:
+      cursor.execute(sql, params)
+      row = cursor.fetchone()
+    # End the read snapshot, so the next call sees rows committed since.
+    self.lookup.commit()
+    return row
+
+  def max_id(self, resort_id: str, slope_name: str, start: dt.datetime, end: dt.datetime) -> Optional[int]:
+    row = self.query_one(
+      f"""
+        SELECT MAX(id) AS max_id FROM `{self.table}`
+        WHERE resort_id = %s AND slope_name = %s AND captured_at >= %s AND captured_at < %s
+      """,
+      (resort_id, slope_name, start, end),
+    )
+    return row["max_id"] if row else None
+
+  def has_late_frames(
+    self, resort_id: str, slope_name: str, after_id: int, start: dt.datetime, until: dt.datetime
+  ) -> bool:
+    # Rows committed after the watermark that belong at or before `until`.
+    return self.query_one(
+      f"""
+        SELECT 1 AS late FROM `{self.table}`
+        WHERE resort_id = %s AND slope_name = %s AND captured_at >= %s AND captured_at <= %s AND id > %s
+        LIMIT 1
+      """,
+      (resort_id, slope_name, start, until, after_id),
+    ) is not None
+
+  def resolve(self, digest: Optional[str], image_format: str) -> Optional[bytes]:
+    if not digest:
+      return None
+    try:
+      return self.blobs.get(digest, image_format)
+    except FileNotFoundError:
+      pass
+
+    row = self.query_one(
+      f"SELECT image_bytes FROM `{self.table}` WHERE image_hash = %s AND image_bytes IS NOT NULL LIMIT 1",
+      (digest,),
+    )
+    return row["image_bytes"] if row else None
+
+  def close(self):
+    if self.lookup is not None:
+      self.lookup.close()
+      self.lookup = None
+
+
+def decode_rgb(image_bytes: bytes, size: Optional[Tuple[int, int]]) -> Optional[Tuple[bytes, Tuple[int, int]]]:
+  try:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+      image = image.convert("RGB")
+      if size and image.size != size:
+        image = image.resize(size, Image.Resampling.BILINEAR)
+      return image.tobytes(), image.size
+  except (OSError, ValueError) as exc:
+    logging.warning("Could not decode stored frame: %s", exc)
+    return None
+
+
+def encoder_command(config: Dict[str, object], size: Tuple[int, int], output: Path, output_format: str) -> List[str]:
+  width, height = size
+  cmd = [
+    config["ffmpeg_bin"],
+    "-loglevel",
+    "error",
+    "-y",
+    "-f",
+    "rawvideo",
+    "-pix_fmt",
+    "rgb24",
+    "-s",
+    f"{width}x{height}",
+    "-r",
+    str(config["clip_fps"]),
+    "-i",
+    "pipe:0",
+    "-vf",
+    "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+    *CODECS[config["clip_codec"]],
+  ]
+  if output_format == "hls":
+    # Every extension appends whole segments to the same EVENT playlist;
+    # append_list continues the segment numbering from it.
+    cmd += [
+      "-g",
+      str(config["clip_fps"] * HLS_SEGMENT_SECONDS),
+      "-f",
+      "hls",
+      "-hls_time",
+      str(HLS_SEGMENT_SECONDS),
+      "-hls_playlist_type",
+      "event",
+      "-hls_flags",
+      "append_list+omit_endlist",
+      "-hls_segment_filename",
+      str(output.with_name(f"{output.stem}_%05d.ts")),
+    ]
+  else:
+    cmd += ["-movflags", "+faststart", "-f", "mp4"]
+  return cmd + [str(output)]
+
+
+def encode_frames(
+  frames: Iterator[Frame],
+  config: Dict[str, object],
+  output: Path,
+  output_format: str,
+  size: Optional[Tuple[int, int]] = None,
+) -> Tuple[int, Optional[dt.datetime], Optional[Tuple[int, int]]]:
+  # Decodes each stored frame to RGB and writes it straight into a single
+  # ffmpeg process, so at most one frame is in memory at a time. ffmpeg is
+  # only started once the first frame (and with it the size) is known.
+  # Returns (frames written, last captured_at, frame size).
+  process = None
+  count = 0
+  last_captured_at = None
+  try:
+    for captured_at, image_bytes in frames:
+      decoded = decode_rgb(image_bytes, size)
+      if not decoded:
+        continue
+      rgb, size = decoded
+      if process is None:
+        process = subprocess.Popen(
+          encoder_command(config, size, output, output_format),
+          stdin=subprocess.PIPE,
+        )
+      process.stdin.write(rgb)
+      count += 1
+      last_captured_at = captured_at
+  except BaseException:
+    if process:
+      process.kill()
+      process.wait()
+    raise
+
+  if process:
+    process.stdin.close()
+    if process.wait() != 0:
+      raise RuntimeError(f"ffmpeg exited with {process.returncode} while writing {output}")
+  return count, last_captured_at, size
+
+
+def concat_mp4(config: Dict[str, object], first: Path, second: Path, output: Path):
+  # Both parts come from the same encoder settings, so they can be joined
+  # without re-encoding.
+  with tempfile.NamedTemporaryFile("w", suffix=".txt", dir=output.parent, delete=False) as fh:
+    fh.write(f"file '{first.resolve()}'\nfile '{second.resolve()}'\n")
+    list_path = Path(fh.name)
+  try:
+    subprocess.run(
+      [
+        config["ffmpeg_bin"], "-loglevel", "error", "-y",
+        "-f", "concat", "-safe", "0", "-i", str(list_path),
+        "-c", "copy", "-movflags", "+faststart", str(output),
+      ],
+      check=True,
+    )
+  finally:
+    list_path.unlink()
+
+
+def clip_paths(config: Dict[str, object], resort_id: str, slope_name: str, day: dt.date, output_format: str) -> Tuple[Path, Path]:
+  directory = config["clip_dir"] / resort_id / slope_name.replace("/", "_")
+  stem = f"{day.isoformat()}.{config['clip_codec']}"
+  output = directory / (f"{stem}.m3u8" if output_format == "hls" else f"{stem}.mp4")
+  return output, directory / f"{stem}.{output_format}.json"
+
+
+def remove_clip(output: Path):
+  output.unlink(missing_ok=True)
+  for segment in output.parent.glob(f"{output.stem}_*.ts"):
+    segment.unlink(missing_ok=True)
+
+
+def load_clip_state(path: Path) -> Dict[str, object]:
+  try:
+    with path.open(encoding="utf-8") as fh:
+      return json.load(fh)
+  except (FileNotFoundError, ValueError):
+    return {}
+
+
+def build_daily_clip(
+  config: Dict[str, object], source: FrameSource, resort_id: str, slope_name: str, day: dt.date, output_format: str
+) -> Optional[Path]:
+  # Clips are cached per camera and UTC day next to a small state file with
+  # the last frame they contain and the id watermark of the rows read. A
+  # later run only encodes the frames after that: MP4 clips get the new part
+  # concatenated on, HLS playlists get new segments appended. A frame that
+  # was committed late but belongs before the clip's end cannot be appended,
+  # so the clip is rebuilt. Once the day has been over for
+  # clip_complete_grace the clip is marked complete and never touched again.
+  output, state_path = clip_paths(config, resort_id, slope_name, day, output_format)
+  state = load_clip_state(state_path)
+  if state and (not output.exists() or "max_id" not in state):
+    state = {}
+  if state.get("complete"):
+    return output
+
+  output.parent.mkdir(parents=True, exist_ok=True)
+  day_start = dt.datetime.combine(day, dt.time.min)
+  day_end = day_start + dt.timedelta(days=1)
+  if state and source.has_late_frames(
+    resort_id, slope_name, state["max_id"], day_start, dt.datetime.fromisoformat(state["last_captured_at"])
+  ):
+    logging.info("Late frames for %s (%s) on %s; rebuilding %s", resort_id, slope_name, day, output)
+    state = {}
+  if not state:
+    remove_clip(output)
+
+  # Rows committed while this run encodes are left for the next one.
+  max_id = source.max_id(resort_id, slope_name, day_start, day_end)
+  # captured_at has one-second resolution.
+  since = dt.datetime.fromisoformat(state["last_captured_at"]) + dt.timedelta(seconds=1) if state else day_start
+  size = tuple(state["size"]) if state.get("size") else None
+  frames = source.frames(resort_id, slope_name, since, day_end, max_id)
+
+  if output_format == "hls" or not state:
+    count, last_captured_at, size = encode_frames(frames, config, output, output_format, size)
+  else:
+    part = output.with_name(f".{output.stem}.part.mp4")
+    count, last_captured_at, size = encode_frames(frames, config, part, output_format, size)
+    if count:
+      joined = output.with_name(f".{output.stem}.joined.mp4")
+      concat_mp4(config, output, part, joined)
+      os.replace(joined, output)
+    part.unlink(missing_ok=True)
+
+  if count:
+    state.update({
+      "frames": state.get("frames", 0) + count,
+      "last_captured_at": last_captured_at.isoformat(),
+      "size": list(size),
+    })
+    logging.info("Added %s frames to %s", count, output)
+  elif not state:
+    logging.info("No frames for %s (%s) on %s", resort_id, slope_name, day)
+    return None
+  state["max_id"] = max_id
+
+  if day_end + config["clip_complete_grace"] <= dt.datetime.utcnow():
+    state["complete"] = True
+    if output_format == "hls":
+      with output.open("a", encoding="utf-8") as fh:
+        fh.write("#EXT-X-ENDLIST\n")
+
+  tmp_path = state_path.with_name(state_path.name + ".tmp")
+  tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+  os.replace(tmp_path, state_path)
+  return output
+
+
+def build_range(
+  config: Dict[str, object], source: FrameSource, resort_id: str, slope_name: str,
+  start: dt.datetime, end: dt.datetime, output: Path,
+):
+  output_format = "hls" if output.suffix == ".m3u8" else "mp4"
+  output.parent.mkdir(parents=True, exist_ok=True)
+  frames = source.frames(resort_id, slope_name, start, end)
+  count, _, _ = encode_frames(frames, config, output, output_format)
+  logging.info("Wrote %s frames to %s", count, output)
+
+
+def parse_time(value: str) -> dt.datetime:
+  return dt.datetime.fromisoformat(value)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Build timelapse clips from stored frames")
+  parser.add_argument("resort_id")
+  parser.add_argument("slope_name")
+  parser.add_argument("--day", type=dt.date.fromisoformat, help="UTC day to build or extend (default: today)")
+  parser.add_argument("--format", choices=OUTPUT_FORMATS, default="mp4", help="daily clip output")
+  parser.add_argument("--start", type=parse_time, help="UTC start of a one-off range (with --end and --output)")
+  parser.add_argument("--end", type=parse_time, help="UTC end of a one-off range (exclusive)")
+  parser.add_argument("--output", type=Path, help="output file for a one-off range (.mp4 or .m3u8)")
+  args = parser.parse_args()
+
+  config = load_builder_config()
+  source = FrameSource(config)
+  try:
+    if args.start or args.end or args.output:
+      if not (args.start and args.end and args.output):
+        parser.error("--start, --end and --output go together")
+      build_range(config, source, args.resort_id, args.slope_name, args.start, args.end, args.output)
+    else:
+      day = args.day or dt.datetime.utcnow().date()
+      output = build_daily_clip(config, source, args.resort_id, args.slope_name, day, args.format)
+      if output:
+        print(output)
+  finally:
+    source.close()
+
+
+if __name__ == "__main__":
+  main()
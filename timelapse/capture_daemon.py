@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+import datetime as dt
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from cron_capture import (
+  Capture,
+  FrameWriter,
+  acquire_lock,
+  encode_or_reference,
+  ensure_table,
+  load_config,
+  load_dedupe,
+  load_streams,
+  load_thumbnailer,
+)
+from frame_dedupe import DuplicateFilter
+from thumbnails import Thumbnailer
+
+StreamKey = Tuple[str, str]
+
+
+def load_daemon_config() -> Dict[str, object]:
+  config = load_config()
+  fps = float(os.getenv("DECODER_FPS", "1"))
+  config.update({
+    "capture_interval": max(1, int(os.getenv("CAPTURE_INTERVAL_SECONDS", "60"))),
+    "decoder_fps": fps,
+    "decoder_stall": int(os.getenv("DECODER_STALL_SECONDS", "20")),
+    "decoder_backoff_max": int(os.getenv("DECODER_BACKOFF_MAX_SECONDS", "300")),
+    # A frame older than this is treated as missing rather than reused.
+    "frame_max_age": max(2.0, 3.0 / fps),
+  })
+  return config
+
+
+def read_ppm_frame(stream: BinaryIO) -> Optional[bytes]:
+  # ffmpeg's ppm encoder writes "P6\n<width> <height>\n255\n" and then
+  # width * height * 3 bytes of RGB. Returns None at end of stream.
+  magic = stream.readline()
+  if not magic:
+    return None
+  if magic.strip() != b"P6":
+    raise ValueError("decoder output is not a PPM stream")
+  size = stream.readline()
+  maxval = stream.readline()
+  width, height = (int(value) for value in size.split())
+  if int(maxval) != 255:
+    raise ValueError(f"unexpected PPM maxval {maxval.strip()!r}")
+
+  length = width * height * 3
+  data = stream.read(length)
+  if len(data) < length:
+    return None
+  return magic + size + maxval + data
+
+
+class CameraDecoder:
+  # Keeps one ffmpeg attached to a stream, decoding continuously and writing
+  # raw RGB frames at decoder_fps to a pipe. Only the newest frame is kept, so a
+  # capture is a memory copy instead of a connect/probe/keyframe wait.
+  # ffmpeg is restarted with exponential backoff when it exits, and killed
+  # by check_stall() when it stops producing frames.
+  def __init__(self, frame: Dict[str, str], config: Dict[str, object]):
+    self.frame = frame
+    self.config = config
+    self.lock = threading.Lock()
+    self.stopped = threading.Event()
+    self.process: Optional[subprocess.Popen] = None
+    self.latest: Optional[Tuple[bytes, float]] = None
+    self.last_output = time.monotonic()
+    self.failures = 0
+    self.thread = threading.Thread(
+      target=self.run,
+      name=f"decoder-{frame['resort_id']}-{frame['slope_name']}",
+      daemon=True,
+    )
+
+  def start(self):
+    self.thread.start()
+
+  def stop(self):
+    self.stopped.set()
+    with self.lock:
+      process = self.process
+    if process:
+      process.kill()
+
+  def command(self) -> List[str]:
+    return [
+      self.config["ffmpeg_bin"],
+      "-loglevel",
+      "error",
+      "-nostdin",
+      "-i",
+      self.frame["stream_url"],
+      "-an",
+      "-vf",
+      f"fps={self.config['decoder_fps']},scale={self.config['scale_width']}:-2",
+      "-f",
+      "image2pipe",
+      "-vcodec",
+      "ppm",
+      "pipe:1",
+    ]
+
+  def run(self):
+    while not self.stopped.is_set():
+      frames = self.decode()
+      if self.stopped.is_set():
+        break
+
+      self.failures = 0 if frames else self.failures + 1
+      delay = min(self.config["decoder_backoff_max"], 2 ** self.failures)
+      logging.warning(
+        "Decoder for %s (%s) exited after %s frames; restarting in %ss",
+        self.frame["resort_name"],
+        self.frame["slope_name"],
+        frames,
+        delay,
+      )
+      self.stopped.wait(delay)
+
+  def decode(self) -> int:
+    try:
+      process = subprocess.Popen(
+        self.command(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL,
+      )
+    except OSError as exc:
+      logging.warning("Could not start decoder for %s: %s", self.frame["stream_url"], exc)
+      return 0
+
+    with self.lock:
+      self.process = process
+      self.last_output = time.monotonic()
+
+    frames = 0
+    try:
+      while True:
+        data = read_ppm_frame(process.stdout)
+        if data is None:
+          break
+        now = time.monotonic()
+        with self.lock:
+          self.latest = (data, now)
+          self.last_output = now
+        frames += 1
+    except (ValueError, OSError) as exc:
+      logging.warning("Decoder for %s failed: %s", self.frame["stream_url"], exc)
+    finally:
+      process.kill()
+      process.wait()
+      with self.lock:
+        self.process = None
+    return frames
+
+  def check_stall(self, now: float):
+    with self.lock:
+      process = self.process
+      last_output = self.last_output
+    if process and now - last_output > self.config["decoder_stall"]:
+      logging.warning(
+        "Decoder for %s (%s) stalled for %.0fs; killing it",
+        self.frame["resort_name"],
+        self.frame["slope_name"],
+        now - last_output,
+      )
+      process.kill()
+
+  def snapshot(self, max_age: float) -> Optional[bytes]:
+    with self.lock:
+      latest = self.latest
+    if not latest or time.monotonic() - latest[1] > max_age:
+      return None
+    return latest[0]
+
+
+def stream_key(frame: Dict[str, str]) -> StreamKey:
+  return frame["resort_id"], frame["slope_name"]
+
+
+class DecoderPool:
+  def __init__(self, config: Dict[str, object]):
+    self.config = config
+    self.decoders: Dict[StreamKey, CameraDecoder] = {}
+
+  def sync(self, streams: List[Dict[str, str]]):
+    # Restarts only the decoders whose stream URL changed, so a links.json
+    # update from the scraper does not reset every camera.
+    wanted = {stream_key(frame): frame for frame in streams}
+    for key, decoder in list(self.decoders.items()):
+      frame = wanted.get(key)
+      if frame is None or frame["stream_url"] != decoder.frame["stream_url"]:
+        decoder.stop()
+        del self.decoders[key]
+
+    for key, frame in wanted.items():
+      if key not in self.decoders:
+        decoder = CameraDecoder(frame, self.config)
+        decoder.start()
+        self.decoders[key] = decoder
+    logging.info("Running %s decoders", len(self.decoders))
+
+  def check_stalls(self):
+    now = time.monotonic()
+    for decoder in self.decoders.values():
+      decoder.check_stall(now)
+
+  def stop_all(self):
+    for decoder in self.decoders.values():
+      decoder.stop()
+    self.decoders.clear()
+
+
+def next_tick(interval: int) -> float:
+  return (int(time.time() // interval) + 1) * interval
+
+
+def encode_snapshot(
+  decoder: CameraDecoder,
+  config: Dict[str, object],
+  captured_at: dt.datetime,
+  dedupe: Optional[DuplicateFilter],
+  thumbnails: Optional[Thumbnailer],
+) -> Capture:
+  frame_bytes = decoder.snapshot(config["frame_max_age"])
+  if not frame_bytes:
+    return None, "", None, None
+  return encode_or_reference(frame_bytes, decoder.frame, config, captured_at, dedupe, thumbnails=thumbnails)
+
+
+def capture_tick(
+  pool: DecoderPool,
+  encoders: ThreadPoolExecutor,
+  writer: FrameWriter,
+  dedupe: Optional[DuplicateFilter],
+  thumbnails: Optional[Thumbnailer],
+  config: Dict[str, object],
+  captured_at: dt.datetime,
+):
+  decoders = list(pool.decoders.values())
+  results = encoders.map(lambda decoder: encode_snapshot(decoder, config, captured_at, dedupe, thumbnails), decoders)
+
+  success = 0
+  for decoder, (image_bytes, image_format, reference, on_commit) in zip(decoders, results):
+    frame = decoder.frame
+    if reference:
+      writer.add_reference(frame, captured_at, reference)
+    elif image_bytes:
+      writer.add(frame, captured_at, image_bytes, image_format, on_commit)
+    else:
+      logging.warning("No fresh frame for %s (%s)", frame["resort_name"], frame["slope_name"])
+      continue
+    success += 1
+
+  # Frames a failed flush leaves buffered are retried with the next tick;
+  # the dedupe state only learns about them once they are committed.
+  writer.flush()
+  if dedupe:
+    dedupe.save()
+  if thumbnails:
+    thumbnails.pack_finished(captured_at)
+  logging.info("Captured %s/%s streams at %s UTC", success, len(decoders), captured_at.isoformat())
+
+
+def main():
+  config = load_daemon_config()
+  lock_file = acquire_lock()
+  signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+  writer = FrameWriter(config)
+  ensure_table(writer.connection, config["mysql_table"], config["table_mode"] == "partitioned")
+  dedupe = load_dedupe(config)
+  thumbnails = load_thumbnailer(config)
+
+  pool = DecoderPool(config)
+  streams_file = config["streams_file"]
+  streams_mtime = None
+  interval = config["capture_interval"]
+
+  try:
+    with ThreadPoolExecutor(max_workers=config["encode_workers"]) as encoders:
+      while True:
+        mtime = streams_file.stat().st_mtime
+        if mtime != streams_mtime:
+          streams = list(load_streams(streams_file))
+          if config["max_streams"] > 0:
+            streams = streams[: config["max_streams"]]
+          pool.sync(streams)
+          streams_mtime = mtime
+
+        tick = next_tick(interval)
+        while True:
+          left = tick - time.time()
+          if left <= 0:
+            break
+          time.sleep(min(left, 1.0))
+          pool.check_stalls()
+
+        captured_at = dt.datetime.utcfromtimestamp(tick)
+        capture_tick(pool, encoders, writer, dedupe, thumbnails, config, captured_at)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    pool.stop_all()
+    writer.close()
+    if lock_file:
+      lock_file.close()
+
+
+if __name__ == "__main__":
+  main()
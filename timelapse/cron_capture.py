@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 
+import base64
+import contextlib
 import datetime as dt
+import functools
+import io
 import json
 import logging
 import os
 import shutil
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Iterable, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import pymysql
 from dotenv import load_dotenv
+from PIL import Image
+
+from blob_store import BlobStore
+from frame_dedupe import DuplicateFilter, dhash, frame_key
+from partitions import PARTITION_AHEAD_DAYS, list_partitions, partition_clause
+from thumbnails import Thumbnailer
 
 try:
   import fcntl
@@ -21,7 +34,31 @@ except ImportError:
 ROOT_DIR = Path(__file__).resolve().parents[1]
 DEFAULT_LINKS_PATH = ROOT_DIR / "links.json"
 DEFAULT_ENV_PATH = Path(__file__).with_name("timelapse.env")
+DEFAULT_BLOB_DIR = Path(__file__).with_name("frames")
+DEFAULT_DEDUPE_STATE_PATH = Path(__file__).with_name(".timelapse-dedupe.json")
+DEFAULT_THUMB_DIR = Path(__file__).with_name("thumbs")
+DEFAULT_SPILL_DIR = Path(__file__).with_name(".timelapse-spill")
 LOCK_PATH = Path(__file__).with_name(".timelapse.lock")
+WRITE_RETRIES = 3
+MAX_PENDING_BATCHES = 8
+# Room left in max_allowed_packet for the statement text around the rows.
+PACKET_HEADROOM = 64 * 1024
+# Covers the frame listing query (frame_api.py) so it never reads rows or
+# the image_bytes column, only this index.
+LISTING_INDEX = "idx_frame_listing"
+LISTING_COLUMNS = (
+  "`resort_id`, `slope_name`, `captured_at`, `image_hash`, `image_format`, `image_size`, `width`, `height`"
+)
+METADATA_COLUMNS = (
+  ("image_hash", "CHAR(64) NULL"),
+  ("image_size", "INT UNSIGNED NULL"),
+  ("width", "SMALLINT UNSIGNED NULL"),
+  ("height", "SMALLINT UNSIGNED NULL"),
+)
+
+# Runs once the row it was added with has been committed.
+OnCommit = Optional[Callable[[], None]]
+Capture = Tuple[Optional[bytes], str, Optional[Dict[str, object]], OnCommit]
 
 logging.basicConfig(
   level=logging.INFO,
@@ -29,7 +66,15 @@ logging.basicConfig(
 )
 
 
-def load_config() -> Dict[str, object]:
+def resolve_path(value) -> Path:
+  # Relative paths in the env file are relative to the repo root.
+  path = Path(value)
+  if not path.is_absolute():
+    path = (ROOT_DIR / path).resolve()
+  return path
+
+
+def load_config(require_mysql: bool = True, require_ffmpeg: bool = True) -> Dict[str, object]:
   env_file = Path(os.getenv("TIMELAPSE_ENV_FILE", DEFAULT_ENV_PATH))
   if env_file.exists():
     load_dotenv(env_file)
@@ -43,16 +88,27 @@ def load_config() -> Dict[str, object]:
     "MYSQL_DATABASE",
   ]
   missing = [key for key in required_keys if not os.getenv(key)]
-  if missing:
+  if missing and require_mysql:
     raise SystemExit(f"Missing required env vars: {', '.join(missing)}")
 
   ffmpeg_bin = os.getenv("FFMPEG_BIN", "ffmpeg")
-  if not shutil.which(ffmpeg_bin):
+  if require_ffmpeg and not shutil.which(ffmpeg_bin):
     raise SystemExit(f"ffmpeg not found at '{ffmpeg_bin}'. Set FFMPEG_BIN.")
 
-  streams_path = Path(os.getenv("STREAMS_FILE", DEFAULT_LINKS_PATH))
-  if not streams_path.is_absolute():
-    streams_path = (ROOT_DIR / streams_path).resolve()
+  streams_path = resolve_path(os.getenv("STREAMS_FILE", DEFAULT_LINKS_PATH))
+
+  table_mode = os.getenv("TABLE_MODE", "plain").lower()
+  if table_mode not in ("plain", "partitioned"):
+    raise SystemExit(f"Unknown TABLE_MODE '{table_mode}' (expected plain or partitioned)")
+
+  storage_mode = os.getenv("STORAGE_MODE", "mysql").lower()
+  if storage_mode not in ("mysql", "blob"):
+    raise SystemExit(f"Unknown STORAGE_MODE '{storage_mode}' (expected mysql or blob)")
+
+  # Captures mostly wait on the network; AV1 encodes are CPU bound, so they
+  # get their own smaller limit and split the cores between them.
+  cpus = os.cpu_count() or 1
+  encode_workers = int(os.getenv("ENCODE_WORKERS", "0")) or max(1, cpus // 2)
 
   return {
     "mysql_host": os.getenv("MYSQL_HOST"),
@@ -65,17 +121,35 @@ def load_config() -> Dict[str, object]:
     "ffmpeg_timeout": int(os.getenv("CAPTURE_TIMEOUT_SECONDS", "15")),
     "scale_width": int(os.getenv("CAPTURE_WIDTH", "1280")),
     "avif_speed": os.getenv("AVIF_SPEED", "6"),
+    "avif_quality": int(os.getenv("AVIF_QUALITY", "60")),
+    "fallback_format": "png" if os.getenv("FALLBACK_FORMAT", "webp").lower() == "png" else "webp",
     "streams_file": streams_path,
     "max_streams": int(os.getenv("MAX_STREAMS_PER_RUN", "0")),
+    "capture_workers": max(1, int(os.getenv("CAPTURE_WORKERS", "8"))),
+    "encode_workers": encode_workers,
+    "encode_threads": max(1, cpus // encode_workers),
+    "capture_deadline": int(os.getenv("CAPTURE_DEADLINE_SECONDS", "50")),
+    "table_mode": table_mode,
+    "storage_mode": storage_mode,
+    "blob_dir": resolve_path(os.getenv("BLOB_DIR", DEFAULT_BLOB_DIR)),
+    "dedupe_distance": int(os.getenv("DEDUPE_DISTANCE", "4")),
+    "dedupe_state_file": resolve_path(os.getenv("DEDUPE_STATE_FILE", DEFAULT_DEDUPE_STATE_PATH)),
+    "frozen_after": int(os.getenv("FROZEN_AFTER_SECONDS", "1800")),
+    "thumb_dir": resolve_path(os.getenv("THUMB_DIR", DEFAULT_THUMB_DIR)),
+    "thumbnail_widths": [int(width) for width in os.getenv("THUMBNAIL_WIDTHS", "640,320").split(",") if width.strip()],
+    "sprite_tile_width": int(os.getenv("SPRITE_TILE_WIDTH", "160")),
+    "sprite_columns": max(1, int(os.getenv("SPRITE_COLUMNS", "10"))),
+    "batch_bytes": max(1, int(os.getenv("MYSQL_BATCH_BYTES", str(8 * 1024 * 1024)))),
+    "spill_dir": resolve_path(os.getenv("SPILL_DIR", DEFAULT_SPILL_DIR)),
   }
 
 
-def acquire_lock():
+def acquire_lock(path: Path = LOCK_PATH):
   if not fcntl:
     logging.warning("fcntl unavailable; skipping lock (may allow overlaps)")
     return None
 
-  lock_file = LOCK_PATH.open("w")
+  lock_file = path.open("w")
   try:
     fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
   except BlockingIOError:
@@ -108,69 +182,29 @@ def load_streams(path: Path) -> Iterable[Dict[str, str]]:
       }
 
 
-def capture_avif(
-  stream_url: str, config: Dict[str, object]
-) -> Tuple[Optional[bytes], str]:
-  ffmpeg_bin = config["ffmpeg_bin"]
+def remaining_timeout(config: Dict[str, object], deadline: Optional[float]) -> Optional[float]:
   timeout = config["ffmpeg_timeout"]
-  scale_width = config["scale_width"]
-  avif_speed = config["avif_speed"]
-
-  avif_cmd = [
-    ffmpeg_bin,
-    "-loglevel",
-    "error",
-    "-nostdin",
-    "-y",
-    "-i",
-    stream_url,
-    "-frames:v",
-    "1",
-    "-vf",
-    f"scale={scale_width}:-2",
-    "-an",
-    "-c:v",
-    "libaom-av1",
-    "-still-picture",
-    "1",
-    "-cpu-used",
-    str(avif_speed),
-    "-f",
-    "image2",
-    "pipe:1",
-  ]
-
-  try:
-    result = subprocess.run(
-      avif_cmd,
-      stdout=subprocess.PIPE,
-      stderr=subprocess.PIPE,
-      timeout=timeout,
-      check=True,
-    )
-    if result.stdout:
-      return result.stdout, "avif"
-    logging.warning("ffmpeg produced empty output for %s", stream_url)
-  except subprocess.TimeoutExpired:
-    logging.warning("ffmpeg timed out for %s", stream_url)
-  except subprocess.CalledProcessError as exc:
-    stderr = exc.stderr.decode(errors="ignore") if exc.stderr else ""
-    logging.warning("ffmpeg failed for %s: %s", stream_url, stderr.strip())
-
-  png_bytes = capture_png(stream_url, config)
-  if not png_bytes:
-    return None, ""
-
-  avif_bytes = convert_png_to_avif(png_bytes, config)
-  return avif_bytes, "avif" if avif_bytes else ""
+  if deadline is None:
+    return timeout
+  left = deadline - time.monotonic()
+  if left <= 0:
+    return None
+  return min(timeout, left)
 
 
-def capture_png(stream_url: str, config: Dict[str, object]) -> Optional[bytes]:
+def capture_frame(
+  stream_url: str, config: Dict[str, object], deadline: Optional[float] = None
+) -> Optional[bytes]:
+  # Decodes one frame and hands it over uncompressed (PPM), so encoding and
+  # any fallback happen in-process without fetching the stream again.
   ffmpeg_bin = config["ffmpeg_bin"]
-  timeout = config["ffmpeg_timeout"]
   scale_width = config["scale_width"]
+  timeout = remaining_timeout(config, deadline)
+  if timeout is None:
+    logging.warning("Capture deadline passed before %s", stream_url)
+    return None
 
-  png_cmd = [
+  cmd = [
     ffmpeg_bin,
     "-loglevel",
     "error",
@@ -184,131 +218,461 @@ def capture_png(stream_url: str, config: Dict[str, object]) -> Optional[bytes]:
     f"scale={scale_width}:-2",
     "-an",
     "-f",
-    "image2",
+    "image2pipe",
     "-vcodec",
-    "png",
+    "ppm",
     "pipe:1",
   ]
 
   try:
     result = subprocess.run(
-      png_cmd,
+      cmd,
       stdout=subprocess.PIPE,
       stderr=subprocess.PIPE,
       timeout=timeout,
       check=True,
     )
     if result.stdout:
-      logging.info("Captured PNG fallback for %s", stream_url)
       return result.stdout
+    logging.warning("ffmpeg produced empty output for %s", stream_url)
   except subprocess.TimeoutExpired:
-    logging.warning("PNG capture timed out for %s", stream_url)
+    logging.warning("ffmpeg timed out for %s", stream_url)
   except subprocess.CalledProcessError as exc:
     stderr = exc.stderr.decode(errors="ignore") if exc.stderr else ""
-    logging.warning("PNG capture failed for %s: %s", stream_url, stderr.strip())
+    logging.warning("ffmpeg failed for %s: %s", stream_url, stderr.strip())
   return None
 
 
-def convert_png_to_avif(png_bytes: bytes, config: Dict[str, object]) -> Optional[bytes]:
-  ffmpeg_bin = config["ffmpeg_bin"]
-  timeout = config["ffmpeg_timeout"]
-  avif_speed = config["avif_speed"]
+def decode_frame(frame_bytes: bytes) -> Optional[Image.Image]:
+  try:
+    image = Image.open(io.BytesIO(frame_bytes))
+    image.load()
+    return image
+  except (OSError, ValueError) as exc:
+    logging.warning("Could not read captured frame: %s", exc)
+    return None
 
-  cmd = [
-    ffmpeg_bin,
-    "-loglevel",
-    "error",
-    "-nostdin",
-    "-y",
-    "-f",
-    "image2pipe",
-    "-vcodec",
-    "png",
-    "-i",
-    "pipe:0",
-    "-frames:v",
-    "1",
-    "-an",
-    "-c:v",
-    "libaom-av1",
-    "-still-picture",
-    "1",
-    "-cpu-used",
-    str(avif_speed),
-    "-f",
-    "image2",
-    "pipe:1",
-  ]
 
+def encode_image(image: Image.Image, config: Dict[str, object]) -> Tuple[bytes, str]:
+  output = io.BytesIO()
   try:
-    result = subprocess.run(
-      cmd,
-      input=png_bytes,
-      stdout=subprocess.PIPE,
-      stderr=subprocess.PIPE,
-      timeout=timeout,
-      check=True,
+    image.save(
+      output,
+      format="AVIF",
+      quality=config["avif_quality"],
+      speed=int(config["avif_speed"]),
+      max_threads=config["encode_threads"],
     )
-    if result.stdout:
-      return result.stdout
-  except subprocess.TimeoutExpired:
-    logging.warning("PNG->AVIF conversion timed out")
-  except subprocess.CalledProcessError as exc:
-    stderr = exc.stderr.decode(errors="ignore") if exc.stderr else ""
-    logging.warning("PNG->AVIF conversion failed: %s", stderr.strip())
-  return None
+    return output.getvalue(), "avif"
+  except (KeyError, OSError, ValueError) as exc:
+    # KeyError: this Pillow build has no AVIF support.
+    logging.warning("AVIF encode failed (%s); storing %s instead", exc, config["fallback_format"])
+
+  output = io.BytesIO()
+  if config["fallback_format"] == "webp":
+    image.save(output, format="WEBP", quality=config["avif_quality"], method=4)
+  else:
+    image.save(output, format="PNG", compress_level=6)
+  return output.getvalue(), config["fallback_format"]
+
+
+def encode_or_reference(
+  frame_bytes: bytes,
+  frame: Dict[str, str],
+  config: Dict[str, object],
+  captured_at: dt.datetime,
+  dedupe: Optional[DuplicateFilter] = None,
+  encode_slots: Optional[threading.BoundedSemaphore] = None,
+  thumbnails: Optional[Thumbnailer] = None,
+) -> Capture:
+  # Returns (image_bytes, image_format, None, on_commit) for a newly encoded
+  # frame, or (None, format, previous frame metadata, None) when the frame
+  # is a near duplicate of the camera's last stored one and was not encoded
+  # at all. Thumbnails are made from the same decoded image as the frame.
+  #
+  # on_commit records the frame as the camera's last stored one. It must
+  # only run once the frame's row is committed (FrameWriter does that):
+  # later rows reference the frame by hash, and a reference to a frame that
+  # was never written cannot be resolved.
+  fingerprint = dhash(frame_bytes) if dedupe else None
+  if fingerprint:
+    reference = dedupe.match(frame_key(frame), fingerprint[0], captured_at)
+    if reference:
+      return None, reference["image_format"], reference, None
+
+  with encode_slots or contextlib.nullcontext():
+    image = decode_frame(frame_bytes)
+    if image is None:
+      return None, "", None, None
+    image_bytes, image_format = encode_image(image, config)
+    if thumbnails:
+      try:
+        thumbnails.write(frame, captured_at, image, BlobStore.digest(image_bytes))
+      except OSError as exc:
+        logging.warning("Could not write thumbnails for %s (%s): %s", frame["resort_name"], frame["slope_name"], exc)
+
+  on_commit = None
+  if fingerprint:
+    on_commit = functools.partial(
+      dedupe.remember, frame_key(frame), fingerprint[0], captured_at, image_bytes, image_format, fingerprint[1]
+    )
+  return image_bytes, image_format, None, on_commit
 
 
-def ensure_table(connection, table_name: str):
+def capture_avif(
+  frame: Dict[str, str],
+  config: Dict[str, object],
+  captured_at: dt.datetime,
+  encode_slots: Optional[threading.BoundedSemaphore] = None,
+  deadline: Optional[float] = None,
+  dedupe: Optional[DuplicateFilter] = None,
+  thumbnails: Optional[Thumbnailer] = None,
+) -> Capture:
+  # Only the encode runs under encode_slots, so the network wait does not
+  # hold a CPU slot.
+  frame_bytes = capture_frame(frame["stream_url"], config, deadline)
+  if not frame_bytes:
+    return None, "", None, None
+  return encode_or_reference(frame_bytes, frame, config, captured_at, dedupe, encode_slots, thumbnails)
+
+
+def ensure_table(connection, table_name: str, partitioned: bool = False):
+  # Partitioned tables need captured_at in every unique key, so it joins
+  # the primary key there.
+  primary_key = "PRIMARY KEY (`id`, `captured_at`)" if partitioned else "PRIMARY KEY (`id`)"
+  options = ""
+  if partitioned:
+    today = dt.datetime.utcnow().date()
+    options = partition_clause(today - dt.timedelta(days=1), today + dt.timedelta(days=PARTITION_AHEAD_DAYS))
+
   create_sql = f"""
     CREATE TABLE IF NOT EXISTS `{table_name}` (
-      `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+      `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
       `resort_id` VARCHAR(64) NOT NULL,
       `resort_name` VARCHAR(255) NOT NULL,
       `slope_name` VARCHAR(255) NOT NULL,
       `stream_url` TEXT,
       `captured_at` DATETIME NOT NULL,
       `image_format` VARCHAR(8) NOT NULL,
-      `image_bytes` LONGBLOB NOT NULL,
+      `image_bytes` LONGBLOB NULL,
+      `image_hash` CHAR(64) NULL,
+      `image_size` INT UNSIGNED NULL,
+      `width` SMALLINT UNSIGNED NULL,
+      `height` SMALLINT UNSIGNED NULL,
       `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      UNIQUE KEY `uniq_capture` (`resort_id`, `slope_name`, `captured_at`)
-    ) CHARACTER SET utf8mb4;
+      {primary_key},
+      UNIQUE KEY `uniq_capture` (`resort_id`, `slope_name`, `captured_at`),
+      KEY `idx_image_hash` (`image_hash`),
+      KEY `{LISTING_INDEX}` ({LISTING_COLUMNS})
+    ) CHARACTER SET utf8mb4
+    {options};
   """
   with connection.cursor() as cursor:
     cursor.execute(create_sql)
   connection.commit()
 
+  # Migrating an older table rebuilds it, which can take a long time on a
+  # large frame table, so it is never done here, inside the capture lock.
+  pending = pending_migrations(connection, table_name)
+  if any(not clause.startswith("ADD KEY") for clause in pending):
+    raise SystemExit(f"{table_name} predates the current schema; run migrate_table.py once (it rebuilds the table)")
+  if pending:
+    logging.warning("%s has no %s index; run migrate_table.py to speed up frame listings", table_name, LISTING_INDEX)
+
+  if partitioned and not list_partitions(connection, table_name):
+    logging.warning(
+      "TABLE_MODE=partitioned but %s already exists unpartitioned; see README to convert it", table_name
+    )
 
-def save_frame(
-  connection,
-  table_name: str,
-  frame: Dict[str, str],
-  captured_at: dt.datetime,
-  image_bytes: bytes,
-  image_format: str,
-):
-  sql = f"""
+
+def pending_migrations(connection, table_name: str) -> List[str]:
+  # ALTER TABLE clauses that bring a table created by an older version up
+  # to date: tables from before blob storage lack the metadata columns and
+  # have a NOT NULL image_bytes, and none of them have the listing index.
+  with connection.cursor() as cursor:
+    cursor.execute(
+      """
+        SELECT COLUMN_NAME AS name, IS_NULLABLE AS nullable FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+      """,
+      (table_name,),
+    )
+    columns = {row["name"]: row["nullable"] for row in cursor.fetchall()}
+    cursor.execute(
+      """
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1
+      """,
+      (table_name, LISTING_INDEX),
+    )
+    has_listing_index = bool(cursor.fetchall())
+
+  clauses = [f"ADD COLUMN `{name}` {definition}" for name, definition in METADATA_COLUMNS if name not in columns]
+  if columns.get("image_bytes") == "NO":
+    clauses.append("MODIFY `image_bytes` LONGBLOB NULL")
+  if not has_listing_index:
+    clauses.append(f"ADD KEY `{LISTING_INDEX}` ({LISTING_COLUMNS})")
+  return clauses
+
+
+def insert_sql(table_name: str) -> str:
+  return f"""
     INSERT INTO `{table_name}` (
-      resort_id, resort_name, slope_name, stream_url,
-      captured_at, image_format, image_bytes
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+      resort_id, resort_name, slope_name, stream_url, captured_at,
+      image_format, image_bytes, image_hash, image_size, width, height
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     ON DUPLICATE KEY UPDATE
       stream_url = VALUES(stream_url),
       image_format = VALUES(image_format),
-      image_bytes = VALUES(image_bytes)
+      image_bytes = VALUES(image_bytes),
+      image_hash = VALUES(image_hash),
+      image_size = VALUES(image_size),
+      width = VALUES(width),
+      height = VALUES(height)
   """
-  values = (
-    frame["resort_id"],
-    frame["resort_name"],
-    frame["slope_name"],
-    frame["stream_url"],
-    captured_at,
-    image_format,
-    image_bytes,
-  )
+
+
+def image_dimensions(image_bytes: bytes) -> Tuple[Optional[int], Optional[int]]:
+  # Image.open only parses the header here; no pixels are decoded.
+  try:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+      return image.size
+  except (OSError, ValueError):
+    return None, None
+
+
+def row_bytes(row: Tuple) -> int:
+  # Only inline image bytes count against the batch budget.
+  return len(row[6] or b"")
+
+
+def max_allowed_packet(connection) -> int:
   with connection.cursor() as cursor:
-    cursor.execute(sql, values)
-  connection.commit()
+    cursor.execute("SELECT @@max_allowed_packet AS packet")
+    return int(cursor.fetchone()["packet"])
+
+
+def encode_row(row: Tuple) -> str:
+  values = list(row)
+  values[4] = row[4].isoformat()
+  values[6] = base64.b64encode(row[6]).decode("ascii") if row[6] is not None else None
+  return json.dumps(values, separators=(",", ":"))
+
+
+def decode_row(line: str) -> Tuple:
+  values = json.loads(line)
+  values[4] = dt.datetime.fromisoformat(values[4])
+  values[6] = base64.b64decode(values[6]) if values[6] is not None else None
+  return tuple(values)
+
+
+class FrameWriter:
+  # Buffers captured frames and writes them with executemany, one commit per
+  # flush instead of one per frame. add() flushes early once the buffered
+  # payload passes batch_bytes, which bounds both memory and transaction
+  # size. Rows stay buffered until their transaction commits: a dropped
+  # connection is reopened and the whole batch retried. A row's on_commit
+  # callback runs after that commit, and never for a row that is dropped
+  # or spilled.
+  #
+  # With STORAGE_MODE=blob the image goes to the BlobStore when it is added
+  # and the row only carries its hash, size, dimensions and format.
+  #
+  # Rows still unwritten at close() are spilled to <spill_dir>/<table>.jsonl
+  # and replayed by the next writer for the same table, so a MySQL outage
+  # longer than one run does not lose the frames captured during it.
+  def __init__(self, config: Dict[str, object]):
+    self.config = config
+    self.sql = insert_sql(config["mysql_table"])
+    self.blobs = BlobStore(config["blob_dir"]) if config["storage_mode"] == "blob" else None
+    self.connection = connect_mysql(config)
+    # One multi-row INSERT must fit in max_allowed_packet (4 MiB by default
+    # on MySQL 5.7), or the server rejects every retry of the batch.
+    # Escaping can double a blob, so a batch gets half the statement.
+    self.max_stmt_length = min(
+      config["batch_bytes"] * 2, max_allowed_packet(self.connection) - PACKET_HEADROOM
+    )
+    self.batch_bytes = max(1, self.max_stmt_length // 2)
+    if self.batch_bytes < config["batch_bytes"]:
+      logging.info("Batches capped at %s bytes by max_allowed_packet", self.batch_bytes)
+    self.spill_path = config["spill_dir"] / f"{config['mysql_table']}.jsonl"
+    self.rows: List[Tuple] = []
+    self.on_commit: List[OnCommit] = []
+    self.pending_bytes = 0
+    self.written = 0
+    self.replayed = self.load_spill()
+
+  def add(
+    self, frame: Dict[str, str], captured_at: dt.datetime, image_bytes: bytes, image_format: str, on_commit: OnCommit = None
+  ):
+    digest = BlobStore.digest(image_bytes)
+    inline_bytes = image_bytes
+    if self.blobs:
+      try:
+        self.blobs.put(image_bytes, image_format, digest)
+        inline_bytes = None
+      except OSError as exc:
+        logging.warning("Blob write failed (%s); storing %s (%s) inline", exc, frame["resort_name"], frame["slope_name"])
+    width, height = image_dimensions(image_bytes)
+    self.append(frame, captured_at, image_format, inline_bytes, digest, len(image_bytes), width, height, on_commit=on_commit)
+
+  def add_reference(self, frame: Dict[str, str], captured_at: dt.datetime, reference: Dict[str, object]):
+    # A near-duplicate frame: the row points at the previous image by hash
+    # and carries no bytes of its own, whatever the storage mode.
+    self.append(
+      frame,
+      captured_at,
+      reference["image_format"],
+      None,
+      reference["image_hash"],
+      reference["image_size"],
+      reference["width"],
+      reference["height"],
+    )
+
+  def append(
+    self,
+    frame: Dict[str, str],
+    captured_at: dt.datetime,
+    image_format: str,
+    inline_bytes: Optional[bytes],
+    *metadata,
+    on_commit: OnCommit = None,
+  ):
+    if inline_bytes and len(inline_bytes) * 2 > self.max_stmt_length and (
+      len(self.connection.escape(inline_bytes)) > self.max_stmt_length
+    ):
+      # It would fail every retry and hold back the rest of its batch.
+      logging.error(
+        "Frame of %s (%s) is %s bytes, too large for max_allowed_packet; skipping",
+        frame["resort_name"],
+        frame["slope_name"],
+        len(inline_bytes),
+      )
+      return
+    self.rows.append((
+      frame["resort_id"],
+      frame["resort_name"],
+      frame["slope_name"],
+      frame["stream_url"],
+      captured_at,
+      image_format,
+      inline_bytes,
+      *metadata,
+    ))
+    self.on_commit.append(on_commit)
+    self.pending_bytes += row_bytes(self.rows[-1])
+    if self.pending_bytes >= self.batch_bytes:
+      self.flush()
+
+  def flush(self) -> bool:
+    if not self.rows:
+      return True
+
+    for attempt in range(WRITE_RETRIES + 1):
+      try:
+        self.connection.ping(reconnect=True)
+        with self.connection.cursor() as cursor:
+          # pymysql packs executemany rows into multi-row INSERTs of up to
+          # max_stmt_length.
+          cursor.max_stmt_length = self.max_stmt_length
+          cursor.executemany(self.sql, self.rows)
+        self.connection.commit()
+        break
+      except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as exc:
+        try:
+          self.connection.rollback()
+        except pymysql.MySQLError:
+          pass
+        if attempt == WRITE_RETRIES:
+          self.drop_overflow()
+          logging.error("Could not write %s frames after %s attempts: %s", len(self.rows), attempt + 1, exc)
+          return False
+        delay = 2 ** attempt
+        logging.warning("MySQL write of %s frames failed (%s); retrying in %ss", len(self.rows), exc, delay)
+        time.sleep(delay)
+
+    self.written += len(self.rows)
+    callbacks = self.on_commit
+    self.rows = []
+    self.on_commit = []
+    self.pending_bytes = 0
+    for callback in callbacks:
+      if callback:
+        callback()
+    if self.replayed:
+      # The replayed rows are committed now, so the spill file is spent.
+      self.spill_path.unlink(missing_ok=True)
+      self.replayed = False
+    return True
+
+  def drop_overflow(self):
+    # Keeps retrying frames across flushes while MySQL is away, but not
+    # without bound: the oldest go first.
+    limit = self.batch_bytes * MAX_PENDING_BATCHES
+    dropped = 0
+    while self.rows and self.pending_bytes > limit:
+      self.pending_bytes -= row_bytes(self.rows.pop(0))
+      self.on_commit.pop(0)
+      dropped += 1
+    if dropped:
+      logging.error("Dropped %s buffered frames while MySQL is unavailable", dropped)
+
+  def load_spill(self) -> bool:
+    try:
+      with self.spill_path.open(encoding="utf-8") as fh:
+        rows = [decode_row(line) for line in fh if line.strip()]
+    except FileNotFoundError:
+      return False
+    except (OSError, ValueError, IndexError, TypeError) as exc:
+      logging.error("Ignoring unreadable spill file %s: %s", self.spill_path, exc)
+      return False
+    self.rows = rows + self.rows
+    self.on_commit = [None] * len(rows) + self.on_commit
+    self.pending_bytes += sum(row_bytes(row) for row in rows)
+    logging.info("Replaying %s frames spilled by an earlier run", len(rows))
+    return True
+
+  def spill(self):
+    # Replaces the spill file with every row still buffered, which includes
+    # any rows replayed from it.
+    self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = self.spill_path.with_name(self.spill_path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
+      for row in self.rows:
+        fh.write(encode_row(row) + "\n")
+    os.replace(tmp_path, self.spill_path)
+    logging.warning("Spilled %s unwritten frames to %s", len(self.rows), self.spill_path)
+
+  def close(self):
+    if not self.flush():
+      try:
+        self.spill()
+      except OSError as exc:
+        logging.error("Could not spill %s unwritten frames: %s", len(self.rows), exc)
+    try:
+      self.connection.close()
+    except pymysql.MySQLError:
+      pass
+
+
+def load_dedupe(config: Dict[str, object]) -> Optional[DuplicateFilter]:
+  # A negative DEDUPE_DISTANCE turns near-duplicate suppression off.
+  if config["dedupe_distance"] < 0:
+    return None
+  return DuplicateFilter(config["dedupe_state_file"], config["dedupe_distance"], config["frozen_after"])
+
+
+def load_thumbnailer(config: Dict[str, object]) -> Optional[Thumbnailer]:
+  if not config["thumbnail_widths"] and config["sprite_tile_width"] <= 0:
+    return None
+  return Thumbnailer(
+    config["thumb_dir"],
+    config["thumbnail_widths"],
+    config["sprite_tile_width"],
+    config["sprite_columns"],
+    lambda image: encode_image(image, config),
+  )
 
 
 def connect_mysql(config: Dict[str, object]):
@@ -336,28 +700,62 @@ def main():
     logging.info("No streams to capture; exiting.")
     return
 
-  connection = connect_mysql(config)
-  ensure_table(connection, config["mysql_table"])
+  writer = FrameWriter(config)
+  ensure_table(writer.connection, config["mysql_table"], config["table_mode"] == "partitioned")
+  dedupe = load_dedupe(config)
+  thumbnails = load_thumbnailer(config)
 
+  # Every frame of a sweep shares one captured_at, however long it takes.
   captured_at = dt.datetime.utcnow().replace(microsecond=0)
-  success = 0
-  for frame in streams:
-    image_bytes, image_format = capture_avif(frame["stream_url"], config)
-    if not image_bytes:
-      logging.warning("Skipping %s (%s) due to capture failure", frame["resort_name"], frame["slope_name"])
-      continue
-    save_frame(connection, config["mysql_table"], frame, captured_at, image_bytes, image_format)
-    success += 1
-    logging.info("Stored %s (%s)", frame["resort_name"], frame["slope_name"])
-
-  connection.close()
+  started = time.monotonic()
+  deadline = started + config["capture_deadline"]
+  encode_slots = threading.BoundedSemaphore(config["encode_workers"])
+  captured = 0
+  duplicates = 0
+
+  # Workers only capture and encode; rows are buffered and written from this
+  # thread since the MySQL connection is not shared between threads.
+  with ThreadPoolExecutor(max_workers=config["capture_workers"]) as pool:
+    futures = {
+      pool.submit(capture_avif, frame, config, captured_at, encode_slots, deadline, dedupe, thumbnails): frame
+      for frame in streams
+    }
+    for future in as_completed(futures):
+      frame = futures[future]
+      image_bytes, image_format, reference, on_commit = future.result()
+      if reference:
+        writer.add_reference(frame, captured_at, reference)
+        captured += 1
+        duplicates += 1
+        logging.info("Unchanged %s (%s)", frame["resort_name"], frame["slope_name"])
+        continue
+      if not image_bytes:
+        logging.warning("Skipping %s (%s) due to capture failure", frame["resort_name"], frame["slope_name"])
+        continue
+      writer.add(frame, captured_at, image_bytes, image_format, on_commit)
+      captured += 1
+      logging.info("Captured %s (%s)", frame["resort_name"], frame["slope_name"])
+
+  writer.close()
+  if dedupe:
+    dedupe.save()
+  if thumbnails:
+    thumbnails.pack_finished(captured_at)
   if lock_file:
     try:
       lock_file.close()
     except Exception:
       pass
 
-  logging.info("Done. Captured %s/%s streams at %s UTC", success, len(streams), captured_at.isoformat())
+  logging.info(
+    "Done. Captured %s/%s streams (%s unchanged) and stored %s at %s UTC in %.1fs",
+    captured,
+    len(streams),
+    duplicates,
+    writer.written,
+    captured_at.isoformat(),
+    time.monotonic() - started,
+  )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime as dt
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pymysql
+
+from blob_store import BlobStore
+from cron_capture import LISTING_COLUMNS, LISTING_INDEX, connect_mysql, load_config
+
+# Read path for stored frames:
+#   GET /frames?resort_id=..&slope_name=..[&start=..&end=..&limit=..&tier=hourly]
+#       lists frame metadata (JSON) from the idx_frame_listing covering index;
+#   GET /frames/<image_hash>            the image itself;
+#   GET /thumbs/<image_hash>/<width>    a pyramid rendition (thumbnails.py);
+#   GET /sprites/<resort>/<slope>/<date>/<HH>.(json|avif|webp|png)
+#       an hourly sprite sheet or its index.
+# Images are addressed by content hash, so they are served with a strong
+# ETag and an immutable cache lifetime. Recently served images stay in an
+# in-process LRU bounded by FRAME_CACHE_BYTES.
+#
+# With --sqlite PATH the service reads a SQLite file with the same table
+# instead of MySQL, for local testing.
+
+PORT = 8790
+IMMUTABLE = "public, max-age=31536000, immutable"
+LISTING_MAX_AGE = 30
+SPRITE_MAX_AGE = 24 * 60 * 60
+DEFAULT_RANGE = dt.timedelta(days=1)
+DEFAULT_LIMIT = 1440
+MAX_LIMIT = 10000
+POOL_SIZE = 8
+TIERS = ("minute", "hourly")
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+SPRITE_PATTERN = re.compile(r"^[^/]+/[^/]+/\d{4}-\d{2}-\d{2}/[0-2]\d\.(json|avif|webp|png)$")
+
+Payload = Tuple[bytes, str]
+
+
+def load_api_config(sqlite_path: Optional[Path]) -> Dict[str, object]:
+  config = load_config(require_mysql=sqlite_path is None, require_ffmpeg=False)
+  config.update({
+    "sqlite_path": sqlite_path,
+    "hourly_table": os.getenv("HOURLY_TABLE") or f"{config['mysql_table']}_hourly",
+    "frame_cache_bytes": int(os.getenv("FRAME_CACHE_BYTES", str(64 * 1024 * 1024))),
+  })
+  return config
+
+
+class FrameCache:
+  # LRU of encoded images keyed by hash, bounded by total bytes. Entries
+  # never go stale because a hash always names the same bytes.
+  def __init__(self, max_bytes: int):
+    self.max_bytes = max_bytes
+    self.entries: "OrderedDict[str, Payload]" = OrderedDict()
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  def get(self, key: str) -> Optional[Payload]:
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return entry
+
+  def put(self, key: str, entry: Payload):
+    if len(entry[0]) > self.max_bytes:
+      return
+    with self.lock:
+      previous = self.entries.pop(key, None)
+      if previous:
+        self.size -= len(previous[0])
+      self.entries[key] = entry
+      self.size += len(entry[0])
+      while self.size > self.max_bytes:
+        _, evicted = self.entries.popitem(last=False)
+        self.size -= len(evicted[0])
+
+
+class FrameStore:
+  # Neither pymysql nor sqlite3 connections may be used by two threads at
+  # once, and the server starts a thread per client connection, so queries
+  # borrow a connection from a small pool of idle ones.
+  def __init__(self, config: Dict[str, object]):
+    self.config = config
+    self.sqlite_path = config["sqlite_path"]
+    self.tables = {"minute": config["mysql_table"], "hourly": config["hourly_table"]}
+    self.blobs = BlobStore(config["blob_dir"])
+    self.idle: "queue.LifoQueue" = queue.LifoQueue(maxsize=POOL_SIZE)
+
+  def connect(self):
+    if self.sqlite_path:
+      connection = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+      connection.row_factory = sqlite3.Row
+      return connection
+    return connect_mysql(self.config)
+
+  def query(self, sql: str, params: Tuple) -> List[Dict[str, object]]:
+    try:
+      connection = self.idle.get_nowait()
+    except queue.Empty:
+      connection = self.connect()
+
+    try:
+      if self.sqlite_path:
+        # Stored as "YYYY-MM-DD HH:MM:SS" text, which compares in time order.
+        params = tuple(value.isoformat(sep=" ") if isinstance(value, dt.datetime) else value for value in params)
+        rows = [dict(row) for row in connection.execute(sql.replace("%s", "?").replace("`", '"'), params)]
+      else:
+        connection.ping(reconnect=True)
+        with connection.cursor() as cursor:
+          cursor.execute(sql, params)
+          rows = cursor.fetchall()
+        connection.commit()
+    except BaseException:
+      connection.close()
+      raise
+
+    try:
+      self.idle.put_nowait(connection)
+    except queue.Full:
+      connection.close()
+    return rows
+
+  def list_frames(
+    self, tier: str, resort_id: str, slope_name: str, start: dt.datetime, end: dt.datetime, limit: int
+  ) -> List[Dict[str, object]]:
+    # Only columns in idx_frame_listing, so MySQL answers from the index.
+    return self.query(
+      f"""
+        SELECT captured_at, image_hash, image_format, image_size, width, height
+        FROM `{self.tables[tier]}`
+        WHERE resort_id = %s AND slope_name = %s AND captured_at >= %s AND captured_at < %s
+        ORDER BY captured_at
+        LIMIT %s
+      """,
+      (resort_id, slope_name, start, end, limit),
+    )
+
+  def image(self, digest: str) -> Optional[Payload]:
+    # Rows for unchanged frames and blob storage share the hash but carry
+    # no bytes, so the one with bytes (if any) is preferred.
+    for table in self.tables.values():
+      rows = self.query(
+        f"""
+          SELECT image_format, image_bytes FROM `{table}`
+          WHERE image_hash = %s
+          ORDER BY image_bytes IS NULL
+          LIMIT 1
+        """,
+        (digest,),
+      )
+      if not rows:
+        continue
+      row = rows[0]
+      if row["image_bytes"] is not None:
+        return bytes(row["image_bytes"]), row["image_format"]
+      try:
+        return self.blobs.get(digest, row["image_format"]), row["image_format"]
+      except FileNotFoundError:
+        continue
+    return None
+
+  def close(self):
+    while True:
+      try:
+        self.idle.get_nowait().close()
+      except queue.Empty:
+        return
+
+
+def ensure_sqlite_table(path: Path, table_names: List[str]):
+  # The SQLite stand-in mirrors the MySQL columns and the listing index.
+  connection = sqlite3.connect(path)
+  try:
+    for table in table_names:
+      connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{table}" (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          resort_id TEXT NOT NULL,
+          resort_name TEXT NOT NULL,
+          slope_name TEXT NOT NULL,
+          stream_url TEXT,
+          captured_at TEXT NOT NULL,
+          image_format TEXT NOT NULL,
+          image_bytes BLOB,
+          image_hash TEXT,
+          image_size INTEGER,
+          width INTEGER,
+          height INTEGER,
+          created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          UNIQUE (resort_id, slope_name, captured_at)
+        )
+      """)
+      connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_image_hash" ON "{table}" (image_hash)')
+      connection.execute(
+        f'CREATE INDEX IF NOT EXISTS "{table}_{LISTING_INDEX}" ON "{table}" ({LISTING_COLUMNS.replace("`", "")})'
+      )
+    connection.commit()
+  finally:
+    connection.close()
+
+
+def parse_time(value: Optional[str]) -> Optional[dt.datetime]:
+  if not value:
+    return None
+  parsed = dt.datetime.fromisoformat(value)
+  if parsed.tzinfo:
+    parsed = parsed.astimezone(dt.timezone.utc).replace(tzinfo=None)
+  return parsed
+
+
+def format_time(value) -> str:
+  return value.isoformat() if isinstance(value, dt.datetime) else str(value).replace(" ", "T")
+
+
+def content_type(image_format: str) -> str:
+  return mimetypes.types_map.get(f".{image_format}") or {
+    "avif": "image/avif",
+    "webp": "image/webp",
+  }.get(image_format, "application/octet-stream")
+
+
+class FrameHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, format, *args):
+    if not self.server.quiet:
+      super().log_message(format, *args)
+
+  def do_GET(self):
+    url = urlsplit(self.path)
+    path = unquote(url.path)
+    try:
+      if path == "/frames":
+        self.list_frames(parse_qs(url.query))
+      elif path.startswith("/frames/"):
+        self.send_frame(path[len("/frames/"):])
+      elif path.startswith("/thumbs/"):
+        self.send_thumbnail(path[len("/thumbs/"):])
+      elif path.startswith("/sprites/"):
+        self.send_sprite(path[len("/sprites/"):])
+      elif path == "/_cache":
+        cache = self.server.cache
+        self.send_json({"entries": len(cache.entries), "bytes": cache.size, "hits": cache.hits, "misses": cache.misses})
+      else:
+        self.send_error(HTTPStatus.NOT_FOUND)
+    except (pymysql.MySQLError, sqlite3.Error) as exc:
+      logging.warning("Query failed for %s: %s", self.path, exc)
+      self.send_error(HTTPStatus.SERVICE_UNAVAILABLE)
+    except (BrokenPipeError, ConnectionResetError):
+      pass
+
+  def list_frames(self, query: Dict[str, List[str]]):
+    def param(name: str, default: Optional[str] = None) -> Optional[str]:
+      values = query.get(name)
+      return values[0] if values else default
+
+    resort_id = param("resort_id")
+    slope_name = param("slope_name")
+    tier = param("tier", "minute")
+    if not resort_id or slope_name is None or tier not in TIERS:
+      self.send_error(HTTPStatus.BAD_REQUEST, "resort_id and slope_name are required; tier is minute or hourly")
+      return
+    try:
+      end = parse_time(param("end")) or dt.datetime.utcnow()
+      start = parse_time(param("start")) or end - DEFAULT_RANGE
+      limit = min(MAX_LIMIT, max(1, int(param("limit", str(DEFAULT_LIMIT)))))
+    except ValueError:
+      self.send_error(HTTPStatus.BAD_REQUEST, "start and end are ISO 8601 times (UTC); limit is a number")
+      return
+
+    # Hourly frames are downsampled copies that never get a pyramid, and the
+    # minute-tier thumbnails they came from are swept by retention.
+    widths = self.server.config["thumbnail_widths"] if tier == "minute" else []
+    frames = []
+    for row in self.server.store.list_frames(tier, resort_id, slope_name, start, end, limit):
+      digest = row["image_hash"]
+      frames.append({
+        "captured_at": format_time(row["captured_at"]),
+        "format": row["image_format"],
+        "size": row["image_size"],
+        "width": row["width"],
+        "height": row["height"],
+        "url": f"/frames/{digest}" if digest else None,
+        "thumbnails": {str(width): f"/thumbs/{digest}/{width}" for width in widths} if digest else {},
+      })
+    self.send_json({"resort_id": resort_id, "slope_name": slope_name, "tier": tier, "frames": frames}, LISTING_MAX_AGE)
+
+  def send_frame(self, digest: str):
+    if not HASH_PATTERN.match(digest):
+      self.send_error(HTTPStatus.NOT_FOUND)
+      return
+    if self.not_modified(f'"{digest}"'):
+      return
+    key = f"frame:{digest}"
+    image = self.server.cache.get(key)
+    if image is None:
+      image = self.server.store.image(digest)
+      if image is None:
+        self.send_error(HTTPStatus.NOT_FOUND)
+        return
+      self.server.cache.put(key, image)
+    self.send_bytes(image[0], content_type(image[1]), f'"{digest}"', IMMUTABLE)
+
+  def send_thumbnail(self, rest: str):
+    digest, _, width = rest.partition("/")
+    if not HASH_PATTERN.match(digest) or not width.isdigit():
+      self.send_error(HTTPStatus.NOT_FOUND)
+      return
+    etag = f'"{digest}-{width}"'
+    if self.not_modified(etag):
+      return
+    key = f"thumb:{digest}:{width}"
+    image = self.server.cache.get(key)
+    if image is None:
+      directory = self.server.config["thumb_dir"] / digest[:2] / digest[2:4]
+      matches = sorted(directory.glob(f"{digest}.{width}.*"))
+      if not matches:
+        self.send_error(HTTPStatus.NOT_FOUND)
+        return
+      image = (matches[0].read_bytes(), matches[0].suffix.lstrip("."))
+      self.server.cache.put(key, image)
+    self.send_bytes(image[0], content_type(image[1]), etag, IMMUTABLE)
+
+  def send_sprite(self, rest: str):
+    if not SPRITE_PATTERN.match(rest) or ".." in rest.split("/"):
+      self.send_error(HTTPStatus.NOT_FOUND)
+      return
+    path = self.server.config["thumb_dir"] / "sprites" / Path(rest)
+    try:
+      stat = path.stat()
+    except FileNotFoundError:
+      self.send_error(HTTPStatus.NOT_FOUND)
+      return
+    # Packed sheets are written once, so size and mtime identify them.
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    if self.not_modified(etag):
+      return
+    suffix = path.suffix.lstrip(".")
+    mime = "application/json" if suffix == "json" else content_type(suffix)
+    self.send_bytes(path.read_bytes(), mime, etag, f"public, max-age={SPRITE_MAX_AGE}")
+
+  def not_modified(self, etag: str) -> bool:
+    if_none_match = self.headers.get("If-None-Match", "")
+    if etag not in [value.strip() for value in if_none_match.split(",")] and if_none_match.strip() != "*":
+      return False
+    self.send_response(HTTPStatus.NOT_MODIFIED)
+    self.send_header("ETag", etag)
+    self.send_header("Content-Length", "0")
+    self.end_headers()
+    return True
+
+  def send_json(self, data, max_age: int = 0):
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+    if self.not_modified(etag):
+      return
+    self.send_bytes(body, "application/json", etag, f"public, max-age={max_age}" if max_age else "no-store")
+
+  def send_bytes(self, body: bytes, mime: str, etag: str, cache_control: str):
+    self.send_response(HTTPStatus.OK)
+    self.send_header("Content-Type", mime)
+    self.send_header("Content-Length", str(len(body)))
+    self.send_header("ETag", etag)
+    self.send_header("Cache-Control", cache_control)
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class FrameServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(self, address, config: Dict[str, object], quiet: bool = False):
+    super().__init__(address, FrameHandler)
+    self.config = config
+    self.store = FrameStore(config)
+    self.cache = FrameCache(config["frame_cache_bytes"])
+    self.quiet = quiet
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve stored timelapse frames over HTTP")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=PORT)
+  parser.add_argument("--sqlite", type=Path, help="read this SQLite file instead of MySQL (created if missing)")
+  parser.add_argument("--quiet", action="store_true", help="do not log each request")
+  args = parser.parse_args()
+
+  config = load_api_config(args.sqlite)
+  if args.sqlite:
+    ensure_sqlite_table(args.sqlite, [config["mysql_table"], config["hourly_table"]])
+
+  with FrameServer((args.host, args.port), config, args.quiet) as httpd:
+    print(f"Serving frames at http://{args.host}:{args.port}/frames")
+    try:
+      httpd.serve_forever()
+    except KeyboardInterrupt:
+      pass
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import datetime as dt
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+HASH_SIZE = 8
+# A reference never points further back than this; an unchanged camera
+# stores a full frame again once a day. Retention drops whole days of
+# frames, so a longer chain could outlive the frame it points at.
+REFERENCE_MAX_AGE = dt.timedelta(hours=24)
+
+
+def dhash(frame_bytes: bytes) -> Optional[Tuple[int, Tuple[int, int]]]:
+  # Difference hash: shrink to 9x8 grayscale and set one bit per pixel that
+  # is brighter than its right neighbour. Sensor noise and compression
+  # artifacts rarely flip a bit, while a moved lift or a lights-on change
+  # flips many. Returns (hash, frame size).
+  try:
+    with Image.open(io.BytesIO(frame_bytes)) as image:
+      size = image.size
+      small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+  except (OSError, ValueError):
+    return None
+
+  pixels = small.tobytes()
+  value = 0
+  for row in range(HASH_SIZE):
+    offset = row * (HASH_SIZE + 1)
+    for col in range(HASH_SIZE):
+      value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+  return value, size
+
+
+def hamming(a: int, b: int) -> int:
+  return bin(a ^ b).count("1")
+
+
+class DuplicateFilter:
+  # Remembers the perceptual hash of the last frame stored per camera. A new
+  # frame within max_distance bits of it is not encoded; the caller stores a
+  # row pointing at the previous image instead. Frames are compared to the
+  # last stored frame rather than the last captured one, so a slow drift
+  # (dusk, snowfall) still gets stored once it adds up.
+  #
+  # State is kept in a JSON file so cron runs see the previous minute.
+  def __init__(self, path: Path, max_distance: int, frozen_after: int):
+    self.path = Path(path)
+    self.max_distance = max_distance
+    self.frozen_after = frozen_after
+    self.lock = threading.Lock()
+    self.state: Dict[str, Dict[str, object]] = {}
+    try:
+      with self.path.open(encoding="utf-8") as fh:
+        data = json.load(fh)
+      if isinstance(data, dict):
+        self.state = data
+    except FileNotFoundError:
+      pass
+    except (OSError, ValueError) as exc:
+      logging.warning("Ignoring unreadable dedupe state %s: %s", self.path, exc)
+
+  def match(self, key: str, phash: int, captured_at: dt.datetime) -> Optional[Dict[str, object]]:
+    # Returns the previous stored frame's metadata when this frame is a
+    # near duplicate of it, and tracks how long the camera has been static.
+    with self.lock:
+      previous = self.state.get(key)
+      if not previous or hamming(phash, int(previous["phash"], 16)) > self.max_distance:
+        return None
+
+      static_since = dt.datetime.fromisoformat(previous.get("static_since") or previous["stored_at"])
+      static_for = (captured_at - static_since).total_seconds()
+      if self.frozen_after > 0 and static_for >= self.frozen_after and not previous.get("frozen"):
+        previous["frozen"] = True
+        logging.warning("%s has not changed for %.0f minutes; stream is probably frozen", key, static_for / 60)
+
+      if captured_at - dt.datetime.fromisoformat(previous["stored_at"]) >= REFERENCE_MAX_AGE:
+        return None
+      return dict(previous)
+
+  def remember(self, key: str, phash: int, captured_at: dt.datetime, image_bytes: bytes, image_format: str, size: Tuple[int, int]):
+    with self.lock:
+      previous = self.state.get(key)
+      static = previous and hamming(phash, int(previous["phash"], 16)) <= self.max_distance
+      if previous and previous.get("frozen") and not static:
+        logging.info("%s is changing again", key)
+      self.state[key] = {
+        "phash": f"{phash:016x}",
+        "stored_at": captured_at.isoformat(),
+        # A daily refresh of an unchanged camera keeps its static streak.
+        "static_since": previous.get("static_since", previous["stored_at"]) if static else captured_at.isoformat(),
+        "frozen": bool(static and previous.get("frozen")),
+        "image_hash": hashlib.sha256(image_bytes).hexdigest(),
+        "image_format": image_format,
+        "image_size": len(image_bytes),
+        "width": size[0],
+        "height": size[1],
+      }
+
+  def save(self):
+    with self.lock:
+      payload = json.dumps(self.state, sort_keys=True, indent=1)
+    tmp_path = self.path.with_name(self.path.name + ".tmp")
+    try:
+      tmp_path.write_text(payload, encoding="utf-8")
+      os.replace(tmp_path, self.path)
+    except OSError as exc:
+      logging.warning("Could not save dedupe state %s: %s", self.path, exc)
+
+
+def frame_key(frame: Dict[str, str]) -> str:
+  return f"{frame['resort_id']}/{frame['slope_name']}"
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import os
+import time
+
+from cron_capture import acquire_lock, connect_mysql, load_config, pending_migrations
+
+# One-off schema migration for frame tables created by an older version:
+# adds the metadata columns, makes image_bytes nullable and adds the frame
+# listing index, all in a single ALTER TABLE so the table is rebuilt once.
+# The capture scripts only check the schema and point here; a rebuild of a
+# multi-GB table does not belong in a per-minute run.
+#
+# It holds the capture lock while it runs, so cron captures skip instead of
+# queueing behind the ALTER. Stop capture_daemon.py first.
+
+
+def table_exists(connection, table_name: str) -> bool:
+  with connection.cursor() as cursor:
+    cursor.execute(
+      "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+      (table_name,),
+    )
+    return bool(cursor.fetchall())
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Bring existing frame tables up to the current schema")
+  parser.add_argument("tables", nargs="*", help="tables to migrate (default: MYSQL_TABLE and the hourly table)")
+  args = parser.parse_args()
+
+  config = load_config(require_ffmpeg=False)
+  table = config["mysql_table"]
+  tables = args.tables or [table, os.getenv("HOURLY_TABLE") or f"{table}_hourly"]
+  lock_file = acquire_lock()
+  connection = connect_mysql(config)
+  try:
+    for name in tables:
+      if not table_exists(connection, name):
+        logging.info("No table %s; skipping", name)
+        continue
+      clauses = pending_migrations(connection, name)
+      if not clauses:
+        logging.info("%s is up to date", name)
+        continue
+
+      logging.info("Migrating %s: %s", name, ", ".join(clauses))
+      started = time.monotonic()
+      with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE `{name}` {', '.join(clauses)}")
+      connection.commit()
+      logging.info("Migrated %s in %.1fs", name, time.monotonic() - started)
+  finally:
+    connection.close()
+    if lock_file:
+      lock_file.close()
+
+
+if __name__ == "__main__":
+  main()
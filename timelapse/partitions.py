@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import datetime as dt
+import logging
+from typing import List, Optional, Tuple
+
+# Partitioned frame tables are split into one RANGE partition per UTC day
+# of captured_at, named p<YYYYMMDD> after the last day they hold, plus a
+# `pmax` catch-all at the end. New days are split off pmax ahead of time,
+# and old days are removed with DROP PARTITION, which unlinks a tablespace
+# file instead of deleting rows one by one. Queries filtering on
+# captured_at only touch the partitions in range.
+MAX_PARTITION = "pmax"
+PARTITION_AHEAD_DAYS = 7
+
+Partition = Tuple[str, Optional[dt.date]]
+
+
+def partition_name(day: dt.date) -> str:
+  return f"p{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[dt.date]:
+  try:
+    return dt.datetime.strptime(name, "p%Y%m%d").date()
+  except ValueError:
+    return None
+
+
+def partition_definition(day: dt.date) -> str:
+  upper = day + dt.timedelta(days=1)
+  return f"PARTITION `{partition_name(day)}` VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))"
+
+
+def partition_clause(first_day: dt.date, last_day: dt.date) -> str:
+  # The first partition also takes everything older than first_day.
+  days = [first_day + dt.timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+  definitions = [partition_definition(day) for day in days]
+  definitions.append(f"PARTITION `{MAX_PARTITION}` VALUES LESS THAN MAXVALUE")
+  return "PARTITION BY RANGE (TO_DAYS(`captured_at`)) (\n  " + ",\n  ".join(definitions) + "\n)"
+
+
+def list_partitions(connection, table_name: str) -> List[Partition]:
+  # Returns [(name, last day held)] in order; the day is None for pmax.
+  # An unpartitioned table has no rows with a partition name.
+  with connection.cursor() as cursor:
+    cursor.execute(
+      """
+        SELECT PARTITION_NAME AS name
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+      """,
+      (table_name,),
+    )
+    return [(row["name"], partition_day(row["name"])) for row in cursor.fetchall()]
+
+
+def add_partitions(connection, table_name: str, through_day: dt.date) -> int:
+  # Splits daily partitions off pmax up to through_day. pmax is normally
+  # empty, so this only rewrites metadata.
+  days = [day for _, day in list_partitions(connection, table_name) if day]
+  if not days:
+    raise RuntimeError(f"{table_name} is not partitioned by day")
+
+  new_days = []
+  day = max(days) + dt.timedelta(days=1)
+  while day <= through_day:
+    new_days.append(day)
+    day += dt.timedelta(days=1)
+  if not new_days:
+    return 0
+
+  definitions = [partition_definition(day) for day in new_days]
+  definitions.append(f"PARTITION `{MAX_PARTITION}` VALUES LESS THAN MAXVALUE")
+  with connection.cursor() as cursor:
+    cursor.execute(
+      f"ALTER TABLE `{table_name}` REORGANIZE PARTITION `{MAX_PARTITION}` INTO ({', '.join(definitions)})"
+    )
+  logging.info("Added %s partitions to %s (through %s)", len(new_days), table_name, through_day)
+  return len(new_days)
+
+
+def drop_partitions(connection, table_name: str, names: List[str]):
+  if not names:
+    return
+  with connection.cursor() as cursor:
+    cursor.execute(f"ALTER TABLE `{table_name}` DROP PARTITION {', '.join(f'`{name}`' for name in names)}")
+  logging.info("Dropped %s partitions from %s: %s", len(names), table_name, ", ".join(names))
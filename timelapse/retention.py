@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime as dt
+import io
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import pymysql
+from PIL import Image
+
+from build_timelapse import FrameSource
+from cron_capture import (
+  FrameWriter,
+  acquire_lock,
+  connect_mysql,
+  encode_image,
+  ensure_table,
+  load_config,
+  load_thumbnailer,
+)
+from partitions import PARTITION_AHEAD_DAYS, Partition, add_partitions, drop_partitions, list_partitions
+
+# Tiered retention for TABLE_MODE=partitioned:
+#   - the last FULL_RETENTION_DAYS days stay at minute cadence and full size
+#     in MYSQL_TABLE;
+#   - older days are downsampled to the first frame per camera per hour,
+#     scaled to HOURLY_WIDTH, copied into HOURLY_TABLE, and then their
+#     partition is dropped from MYSQL_TABLE;
+#   - hourly partitions and sprite sheets older than HOURLY_RETENTION_DAYS
+#     are dropped;
+#   - blob files and thumbnails no row references any more are swept.
+# Rows are never deleted one by one. Run it once a day from cron; it takes
+# its own lock so captures keep running meanwhile.
+RETENTION_LOCK_PATH = Path(__file__).with_name(".timelapse-retention.lock")
+
+
+def load_retention_config() -> Dict[str, object]:
+  # Hourly frames are re-encoded in-process by Pillow; ffmpeg is not needed.
+  config = load_config(require_ffmpeg=False)
+  if config["table_mode"] != "partitioned":
+    raise SystemExit("retention.py needs TABLE_MODE=partitioned")
+  config.update({
+    # Unchanged-frame references reach up to a day back, so a day of full
+    # frames is the minimum that keeps them resolvable.
+    "full_days": max(2, int(os.getenv("FULL_RETENTION_DAYS", "7"))),
+    "hourly_days": int(os.getenv("HOURLY_RETENTION_DAYS", "120")),
+    "hourly_width": int(os.getenv("HOURLY_WIDTH", "640")),
+    "hourly_table": os.getenv("HOURLY_TABLE") or f"{config['mysql_table']}_hourly",
+    "blob_grace": int(os.getenv("BLOB_GC_GRACE_SECONDS", "86400")),
+  })
+  return config
+
+
+def downsample_partition(
+  config: Dict[str, object], connection, source: FrameSource, writer: FrameWriter, name: str
+) -> Optional[int]:
+  # Streams the first frame of every camera-hour in one day partition and
+  # writes a scaled-down copy to the hourly table. Returns the number of
+  # frames copied, or None when they could not all be written.
+  table = config["mysql_table"]
+  sql = f"""
+    SELECT f.resort_id, f.resort_name, f.slope_name, f.stream_url, f.captured_at,
+      f.image_format, f.image_bytes, f.image_hash
+    FROM `{table}` PARTITION (`{name}`) AS f
+    JOIN (
+      SELECT resort_id, slope_name, MIN(captured_at) AS captured_at
+      FROM `{table}` PARTITION (`{name}`)
+      GROUP BY resort_id, slope_name, DATE(captured_at), HOUR(captured_at)
+    ) AS firsts USING (resort_id, slope_name, captured_at)
+    ORDER BY f.captured_at
+  """
+  copied = 0
+  with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+    cursor.execute(sql)
+    for row in cursor:
+      image_bytes = row["image_bytes"] or source.resolve(row["image_hash"], row["image_format"])
+      if image_bytes is None:
+        image_bytes, image_format = latest_hourly_frame(config, source, row)
+      else:
+        image_bytes, image_format = shrink(image_bytes, config)
+      if not image_bytes:
+        logging.warning("No image for %s (%s) at %s; skipping", row["resort_id"], row["slope_name"], row["captured_at"])
+        continue
+      writer.add(row, row["captured_at"], image_bytes, image_format)
+      copied += 1
+
+  return copied if writer.flush() else None
+
+
+def shrink(image_bytes: bytes, config: Dict[str, object]):
+  try:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+      image.load()
+      width = config["hourly_width"]
+      if image.width > width:
+        height = max(2, round(image.height * width / image.width / 2) * 2)
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+      return encode_image(image, config)
+  except (OSError, ValueError) as exc:
+    logging.warning("Could not downsample frame: %s", exc)
+    return None, ""
+
+
+def latest_hourly_frame(config: Dict[str, object], source: FrameSource, row: Dict[str, object]):
+  # An unchanged-frame reference whose original was in an already dropped
+  # day (MySQL storage only): the camera's latest hourly frame shows the
+  # same picture and is already small.
+  if source.lookup is None:
+    source.lookup = connect_mysql(config)
+  with source.lookup.cursor() as cursor:
+    cursor.execute(
+      f"""
+        SELECT image_format, image_bytes, image_hash FROM `{config['hourly_table']}`
+        WHERE resort_id = %s AND slope_name = %s AND captured_at < %s
+        ORDER BY captured_at DESC LIMIT 1
+      """,
+      (row["resort_id"], row["slope_name"], row["captured_at"]),
+    )
+    latest = cursor.fetchone()
+  if not latest:
+    return None, ""
+  image_bytes = latest["image_bytes"] or source.resolve(latest["image_hash"], latest["image_format"])
+  return image_bytes, latest["image_format"]
+
+
+def expired(partitions: List[Partition], cutoff: dt.date) -> List[str]:
+  # Oldest first; a partition named after day D only holds rows up to D.
+  return [name for name, day in partitions if day and day < cutoff]
+
+
+def referenced_hashes(config: Dict[str, object], connection) -> Set[str]:
+  hashes: Set[str] = set()
+  for table in (config["mysql_table"], config["hourly_table"]):
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+      cursor.execute(f"SELECT DISTINCT image_hash FROM `{table}` WHERE image_hash IS NOT NULL")
+      hashes.update(row[0] for row in cursor)
+  try:
+    with config["dedupe_state_file"].open(encoding="utf-8") as fh:
+      hashes.update(entry.get("image_hash") for entry in json.load(fh).values())
+  except (FileNotFoundError, ValueError, AttributeError):
+    pass
+  return hashes
+
+
+def collect_blobs(config: Dict[str, object], connection, roots: List[Path]) -> int:
+  # Mark and sweep over content-addressed trees (frame blobs and thumbnail
+  # pyramids, both named <hash>.<...>). Files younger than the grace period
+  # are kept, so a file written (or re-referenced) while the referenced set
+  # was being read is never removed.
+  roots = [root for root in roots if root.is_dir()]
+  if not roots:
+    return 0
+  hashes = referenced_hashes(config, connection)
+  cutoff = time.time() - config["blob_grace"]
+  removed = 0
+  for root in roots:
+    for path in root.glob("[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*.*"):
+      if path.name.startswith(".") or path.name.split(".", 1)[0] in hashes:
+        continue
+      try:
+        if path.stat().st_mtime < cutoff:
+          path.unlink()
+          removed += 1
+      except FileNotFoundError:
+        pass
+  logging.info("Removed %s unreferenced files (%s hashes referenced)", removed, len(hashes))
+  return removed
+
+
+def prune_sprites(config: Dict[str, object], cutoff: dt.date) -> int:
+  # Sprite sheets are grouped in per-day directories, removed as a whole
+  # once they fall out of hourly retention.
+  removed = 0
+  for day_dir in config["thumb_dir"].glob("sprites/*/*/*"):
+    try:
+      day = dt.date.fromisoformat(day_dir.name)
+    except ValueError:
+      continue
+    if day < cutoff:
+      shutil.rmtree(day_dir, ignore_errors=True)
+      removed += 1
+  if removed:
+    logging.info("Removed %s days of sprite sheets", removed)
+  return removed
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Add, downsample and drop frame table partitions")
+  parser.add_argument("--skip-blobs", action="store_true", help="do not sweep unreferenced blob and thumbnail files")
+  args = parser.parse_args()
+
+  config = load_retention_config()
+  lock_file = acquire_lock(RETENTION_LOCK_PATH)
+  today = dt.datetime.utcnow().date()
+  table = config["mysql_table"]
+  hourly_table = config["hourly_table"]
+
+  connection = connect_mysql(config)
+  ensure_table(connection, table, partitioned=True)
+  ensure_table(connection, hourly_table, partitioned=True)
+  for name in (table, hourly_table):
+    if not list_partitions(connection, name):
+      raise SystemExit(f"{name} is not partitioned; see README to convert it")
+    add_partitions(connection, name, today + dt.timedelta(days=PARTITION_AHEAD_DAYS))
+
+  source = FrameSource(config)
+  writer = FrameWriter({**config, "mysql_table": hourly_table})
+  try:
+    for name in expired(list_partitions(connection, table), today - dt.timedelta(days=config["full_days"])):
+      started = time.monotonic()
+      copied = downsample_partition(config, connection, source, writer, name)
+      if copied is None:
+        logging.error("Keeping %s: its hourly frames could not be written", name)
+        break
+      drop_partitions(connection, table, [name])
+      logging.info("Downsampled %s to %s hourly frames in %.1fs", name, copied, time.monotonic() - started)
+
+    drop_partitions(
+      connection,
+      hourly_table,
+      expired(list_partitions(connection, hourly_table), today - dt.timedelta(days=config["hourly_days"])),
+    )
+
+    thumbnails = load_thumbnailer(config)
+    if thumbnails:
+      thumbnails.pack_finished(dt.datetime.utcnow(), all_days=True)
+    prune_sprites(config, today - dt.timedelta(days=config["hourly_days"]))
+    if not args.skip_blobs:
+      roots = [config["thumb_dir"]]
+      if config["storage_mode"] == "blob":
+        roots.append(config["blob_dir"])
+      collect_blobs(config, connection, roots)
+  finally:
+    writer.close()
+    source.close()
+    connection.close()
+    if lock_file:
+      lock_file.close()
+
+
+if __name__ == "__main__":
+  main()
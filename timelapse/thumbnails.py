@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import datetime as dt
+import io
+import json
+import logging
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from blob_store import BlobStore
+
+Encoder = Callable[[Image.Image], Tuple[bytes, str]]
+
+
+def scaled(image: Image.Image, width: int) -> Image.Image:
+  if image.width <= width:
+    return image
+  height = max(2, round(image.height * width / image.width / 2) * 2)
+  return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+class Thumbnailer:
+  # Derives smaller renditions from the frame that was just decoded, so the
+  # capture pipeline never decodes twice.
+  #
+  # Pyramid: one file per width, <root>/<aa>/<bb>/<frame hash>.<width>.<fmt>,
+  # keyed by the full frame's image_hash. Rows that reference an unchanged
+  # frame therefore find their thumbnails the same way they find the image.
+  #
+  # Sprites: a tile_width tile per captured minute is staged under
+  # <root>/sprites/<resort>/<slope>/<date>/<HH>/<MM>.png. Once the hour is
+  # over, pack_finished() joins the tiles into <HH>.<fmt> (columns wide)
+  # with an <HH>.json index, so a scrubber loads a day in 24 requests.
+  def __init__(self, root: Path, widths: List[int], tile_width: int, columns: int, encoder: Encoder):
+    self.root = Path(root)
+    self.widths = sorted(set(widths), reverse=True)
+    self.tile_width = tile_width
+    self.columns = columns
+    self.encoder = encoder
+    self.pyramid = BlobStore(self.root)
+
+  def write(self, frame: Dict[str, str], captured_at: dt.datetime, image: Image.Image, frame_hash: str):
+    # Each width is scaled from the previous one, which is cheaper than
+    # scaling every level from the full frame.
+    source = image
+    for width in self.widths:
+      source = scaled(source, width)
+      data, image_format = self.encoder(source)
+      self.pyramid.put(data, f"{width}.{image_format}", frame_hash)
+
+    if self.tile_width > 0:
+      tile_dir = self.hour_dir(frame, captured_at)
+      tile_dir.mkdir(parents=True, exist_ok=True)
+      tile_path = tile_dir / f"{captured_at:%M}.png"
+      tmp_path = tile_dir / f".{captured_at:%M}.png.tmp"
+      scaled(source, self.tile_width).save(tmp_path, format="PNG")
+      os.replace(tmp_path, tile_path)
+
+  def day_dir(self, frame: Dict[str, str], day: dt.date) -> Path:
+    slope = frame["slope_name"].replace("/", "_")
+    return self.root / "sprites" / frame["resort_id"] / slope / day.isoformat()
+
+  def hour_dir(self, frame: Dict[str, str], captured_at: dt.datetime) -> Path:
+    return self.day_dir(frame, captured_at.date()) / f"{captured_at:%H}"
+
+  def pack_finished(self, now: dt.datetime, all_days: bool = False) -> int:
+    # Packs every staged hour that has ended. It runs after every sweep, so
+    # by default it only looks at today's and yesterday's directories of
+    # each camera, not every retained day of sprite sheets. all_days (used
+    # by the daily retention job) also picks up hours left staged by a run
+    # that stopped before packing them.
+    current = now.replace(minute=0, second=0, microsecond=0)
+    if all_days:
+      patterns = ["sprites/*/*/*/[0-2][0-9]"]
+    else:
+      days = [current.date() - dt.timedelta(days=1), current.date()]
+      patterns = [f"sprites/*/*/{day.isoformat()}/[0-2][0-9]" for day in days]
+    packed = 0
+    for hour_dir in sorted(path for pattern in patterns for path in self.root.glob(pattern)):
+      try:
+        started = dt.datetime.fromisoformat(f"{hour_dir.parent.name}T{hour_dir.name}:00")
+      except ValueError:
+        continue
+      if started < current and hour_dir.is_dir():
+        self.pack(hour_dir)
+        packed += 1
+    return packed
+
+  def pack(self, hour_dir: Path):
+    tiles = sorted(hour_dir.glob("[0-5][0-9].png"))
+    if tiles:
+      images = [Image.open(path) for path in tiles]
+      try:
+        tile_size = images[0].size
+        rows = math.ceil(len(images) / self.columns)
+        sheet = Image.new("RGB", (tile_size[0] * min(self.columns, len(images)), tile_size[1] * rows))
+        for index, tile in enumerate(images):
+          if tile.size != tile_size:
+            tile = tile.resize(tile_size, Image.Resampling.BILINEAR)
+          sheet.paste(tile, ((index % self.columns) * tile_size[0], (index // self.columns) * tile_size[1]))
+      finally:
+        for tile in images:
+          tile.close()
+
+      data, image_format = self.encoder(sheet)
+      index = {
+        "format": image_format,
+        "tile": list(tile_size),
+        "columns": self.columns,
+        # Minute of each tile in sheet order; minutes without a stored frame
+        # are absent, so a scrubber shows the nearest earlier tile.
+        "minutes": [int(path.stem) for path in tiles],
+      }
+      sheet_path = hour_dir.with_name(f"{hour_dir.name}.{image_format}")
+      write_file(sheet_path, data)
+      write_file(hour_dir.with_name(f"{hour_dir.name}.json"), json.dumps(index, separators=(",", ":")).encode("utf-8"))
+      logging.info("Packed %s tiles into %s", len(tiles), sheet_path)
+    shutil.rmtree(hour_dir, ignore_errors=True)
+
+
+def write_file(path: Path, data: bytes):
+  tmp_path = path.with_name(f".{path.name}.tmp")
+  tmp_path.write_bytes(data)
+  os.replace(tmp_path, path)